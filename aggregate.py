@@ -0,0 +1,38 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Tuple
+from tools import logger
+from sources import News, NewsArticle, source_classes, sources
+
+
+def published(item: Tuple[News, NewsArticle]) -> float:
+    return item[1].publishedAt.timestamp()
+
+
+def fetch_all(topic: str = "", names: Iterable[str] = None, timeout: float = None) -> Iterator[Tuple[News, NewsArticle]]:
+    """
+    并发拉取多个 source, 按 publishedAt 从新到旧 k 路归并成一个 (client, article) 流
+    某个 source 失败或超过 timeout 秒没返回, 只记日志并跳过, 不影响其他 source
+    """
+    clients = [source_classes[name]() for name in (names or sources)]
+    if not clients:
+        return iter(())
+    pool = ThreadPoolExecutor(max_workers=len(clients))
+    futures = {pool.submit(client.get_articles, topic): client for client in clients}
+    done, not_done = wait(futures, timeout=timeout)
+    pool.shutdown(wait=False, cancel_futures=True)
+    for future in not_done:
+        logger.warning(f"Error: {futures[future].source} did not respond in {timeout}s, skipped")
+    streams: List[List[Tuple[News, NewsArticle]]] = []
+    for future in done:
+        client = futures[future]
+        try:
+            articles = future.result()
+        except Exception as e:
+            logger.error("Error: Unable to fetch news from {}, detail: {}".format(client.source, e))
+            continue
+        # 每个 feed 本身基本有序, 排序近似 O(n); 跨 source 用堆归并, 不整体重排
+        stream = [(client, article) for article in articles]
+        stream.sort(key=published, reverse=True)
+        streams.append(stream)
+    return heapq.merge(*streams, key=published, reverse=True)
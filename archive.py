@@ -0,0 +1,138 @@
+"""
+本地只追加的文章归档, 按 source/日期 分区:
+    {root}/{source}/{YYYY-MM-DD}.jsonl       feed 条目, 按 publishedAt 的 UTC 日期分区, 按 id 去重
+    {root}/{source}/{YYYY-MM-DD}.body.jsonl  抓下来的正文, 按抓取日期分区, 按 url 去重
+查询时先按文件名里的日期裁剪分区, 再 mmap 逐行扫描, symbol 过滤先做字节级预筛再解析 json
+"""
+import os
+import json
+import mmap
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+from cache import CACHE_DIR
+from common import to_utc
+from tools import logger
+
+ARCHIVE_DIR = os.environ.get("NEWS_ARCHIVE_DIR", os.path.join(CACHE_DIR, "archive"))
+ARTICLE_SUFFIX = ".jsonl"
+BODY_SUFFIX = ".body.jsonl"
+
+
+def parse_time(value: str) -> datetime:
+    return to_utc(datetime.fromisoformat(value))
+
+
+class Archive:
+
+    def __init__(self, root: str = ARCHIVE_DIR) -> None:
+        self.root = root
+        self._keys: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _partition_keys(self, path: str, field: str) -> Set[str]:
+        keys = self._keys.get(path)
+        if keys is None:
+            keys = {record[field] for record in self._read(path)}
+            self._keys[path] = keys
+        return keys
+
+    def _append(self, path: str, field: str, records: Iterable[dict]) -> int:
+        keys = self._partition_keys(path, field)
+        lines = []
+        for record in records:
+            if record[field] in keys:
+                continue
+            keys.add(record[field])
+            lines.append(json.dumps(record, ensure_ascii=False))
+        if lines:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def append(self, source: str, items: Iterable[dict]) -> int:
+        """
+        追加 feed 的原始条目, 已经归档过的 id 会跳过, 返回新写入的条数
+        symbols 统一转成大写 (和 symbol_index 一致), scan 的字节级预筛才能匹配上
+        """
+        partitions: Dict[str, list] = {}
+        for item in items:
+            symbols = item.get("symbols")
+            if symbols and any(symbol != symbol.upper() for symbol in symbols):
+                item = dict(item, symbols=[symbol.upper() for symbol in symbols])
+            day = parse_time(item["publishedAt"]).date().isoformat()
+            partitions.setdefault(day, []).append(item)
+        added = 0
+        with self._lock:
+            for day, records in partitions.items():
+                added += self._append(os.path.join(self.root, source, day + ARTICLE_SUFFIX), "id", records)
+        if added:
+            logger.info(f"Archived {added} new {source} articles")
+        return added
+
+    def append_body(self, source: str, url: str, body: str) -> bool:
+        now = datetime.now(timezone.utc)
+        record = {"url": url, "fetchedAt": now.isoformat(), "body": body}
+        path = os.path.join(self.root, source, now.date().isoformat() + BODY_SUFFIX)
+        with self._lock:
+            return self._append(path, "url", [record]) == 1
+
+    def _partitions(self, source: Optional[str], suffix: str, start: Optional[date],
+                    end: Optional[date]) -> Iterator[Tuple[str, date]]:
+        if not os.path.isdir(self.root):
+            return
+        for name in sorted(os.listdir(self.root)) if source is None else [source]:
+            directory = os.path.join(self.root, name)
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(suffix) or (suffix == ARTICLE_SUFFIX and filename.endswith(BODY_SUFFIX)):
+                    continue
+                day = date.fromisoformat(filename[:-len(suffix)])
+                if (start and day < start) or (end and day > end):
+                    continue
+                yield os.path.join(directory, filename), day
+
+    @staticmethod
+    def _read(path: str, needle: bytes = b"") -> Iterator[dict]:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b""):
+                if needle and needle not in line:
+                    continue
+                yield json.loads(line)
+
+    def scan(self, source: str = None, start: datetime = None, end: datetime = None,
+             symbol: str = None) -> Iterator[dict]:
+        """
+        按 source、发布时间 [start, end]、symbol 扫描归档, 返回 feed 原始条目
+        """
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+        needle = json.dumps(symbol.upper()).encode() if symbol else b""
+        for path, day in self._partitions(source, ARTICLE_SUFFIX, start and start.date(), end and end.date()):
+            # 只有首尾两天的分区需要逐条比较时间
+            check_time = (start and day == start.date()) or (end and day == end.date())
+            for item in self._read(path, needle):
+                if symbol and symbol.upper() not in (s.upper() for s in item["symbols"]):
+                    continue
+                if check_time:
+                    published = parse_time(item["publishedAt"])
+                    if (start and published < start) or (end and published > end):
+                        continue
+                yield item
+
+    def bodies(self, source: str = None, start: datetime = None, end: datetime = None) -> Iterator[dict]:
+        """
+        按 source 和抓取日期扫描正文记录 {"url", "fetchedAt", "body"}
+        """
+        for path, _ in self._partitions(source, BODY_SUFFIX, start and to_utc(start).date(),
+                                        end and to_utc(end).date()):
+            yield from self._read(path)
+
+
+archive = Archive()
+# NEWS_ARCHIVE=0 关闭归档
+archive_enabled = os.environ.get("NEWS_ARCHIVE", "1") != "0"
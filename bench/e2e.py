@@ -0,0 +1,195 @@
+"""
+端到端 benchmark: 起本地替身服务 (bench.server) 代替 newsfilter、文章站点和 Ollama,
+跑 get_brief、get_summary 和 main.py 的几个流程, 报告 articles/sec、单次 p50/p99 耗时和内存
+缓存、归档和索引都放在临时目录, 每轮前清空内存和磁盘缓存, 测的是冷路径; 后续优化都以这里的结果为基线
+python -m bench.e2e --runs 10 --latency 0.05 --error-rate 0.05 --tokens-per-second 50
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from urllib.parse import urlsplit
+from bench.server import StandIn, from_args, options
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(prog="bench.e2e", parents=[options],
+                                 description="end-to-end throughput against local stand-in backends")
+parser.add_argument('--runs', default=10, type=int)
+parser.add_argument('-s', '--source', default="reuters")
+parser.add_argument('-t', '--topic', default="oil")
+parser.add_argument('-k', '--top-k', default=3, type=int)
+parser.add_argument('--rate', help="per-host request rate limit against the stand-in", default=1000.0, type=float)
+parser.add_argument('--scenario', help="only run these scenarios", action="append", default=[])
+parser.add_argument('-o', '--output', help="also write the results as json", default="")
+parser.add_argument('--verbose', help="keep INFO and WARNING logs", default=False, action="store_true")
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+class Scenarios:
+    """
+    进程内的场景: 调用前清空缓存, 返回这次处理的文章数
+    """
+
+    def __init__(self, args) -> None:
+        from sources import News, source_classes
+
+        self.args = args
+        self.client: News = source_classes[args.source]()
+        self.topic_articles = len(self.client.get_articles(args.topic))
+
+    @staticmethod
+    def cold():
+        from sources import News
+        from cache import content_cache
+        from models import llm_cache
+
+        News._feeds.clear()
+        content_cache.clear()
+        llm_cache.clear()
+
+    def brief(self) -> int:
+        self.cold()
+        self.client.get_brief(self.args.topic)
+        return self.topic_articles
+
+    def brief_all(self) -> int:
+        from aggregate import fetch_all
+        from sources import print_briefs
+
+        self.cold()
+        articles = [article for _, article in fetch_all(self.args.topic)]
+        print_briefs(articles)
+        return len(articles)
+
+    def summary(self) -> int:
+        self.cold()
+        self.client.get_summary(self.args.topic, top_k=self.args.top_k)
+        return min(self.args.top_k, self.topic_articles)
+
+    def summary_fused(self) -> int:
+        self.cold()
+        self.client.get_summary(self.args.topic, top_k=self.args.top_k, fused=True)
+        return min(self.args.top_k, self.topic_articles)
+
+
+class MainFlow:
+    """
+    main.py 子进程, 含启动开销; 内存取子进程的峰值 RSS
+    每次用新的缓存目录, 和进程内场景一样测冷路径
+    """
+
+    def __init__(self, argv, articles: int, env) -> None:
+        self.argv = argv
+        self.articles = articles
+        self.env = env
+        self.peaks = []
+
+    def __call__(self) -> int:
+        env = dict(self.env, NEWS_CACHE_DIR=tempfile.mkdtemp(dir=self.env["NEWS_CACHE_DIR"]))
+        proc = subprocess.Popen([sys.executable, "main.py", *self.argv], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            raise RuntimeError(f"main.py {' '.join(self.argv)} exited with {proc.returncode}")
+        # Linux 上 ru_maxrss 单位是 KiB
+        self.peaks.append(usage.ru_maxrss * 1024)
+        return self.articles
+
+
+def measure(name: str, func, runs: int, standin: StandIn) -> dict:
+    latencies, articles = [], 0
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        if isinstance(func, MainFlow):
+            peak = 0
+        else:
+            # 先预热一次加载模块、建连接池, 再用 tracemalloc 量一次 python 堆的峰值
+            func()
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        standin.reset_stats()
+        for _ in range(runs):
+            start = time.perf_counter()
+            articles += func()
+            latencies.append(time.perf_counter() - start)
+    if isinstance(func, MainFlow):
+        peak = max(func.peaks)
+    stats = standin.reset_stats()
+    return {
+        "scenario": name,
+        "runs": runs,
+        "articles_per_second": articles / sum(latencies),
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+        "peak_bytes": peak,
+        "upstream": {key: value / runs for key, value in stats.items()},
+    }
+
+
+def main():
+    args = parser.parse_args()
+    standin = from_args(args).start()
+    workdir = tempfile.mkdtemp(prefix="news-bench-")
+    env = dict(os.environ, NEWS_CACHE_DIR=workdir, **standin.env())
+    # 必须在 import sources 之前设置, 各模块在 import 时读取这些变量
+    os.environ.update(env)
+
+    from tools import logger
+    from traffic import host_traffic
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="ERROR")
+    host_traffic.set_limit(urlsplit(standin.url).netloc, args.rate, args.rate)
+    scenarios = Scenarios(args)
+    # main.py 的文章数按 feed 算, 子进程里拿不到返回值
+    topic_articles = scenarios.topic_articles
+    cases = {
+        "brief": scenarios.brief,
+        "brief-all": scenarios.brief_all,
+        "summary": scenarios.summary,
+        "summary-fused": scenarios.summary_fused,
+        "main-brief": MainFlow(["-s", args.source, "-t", args.topic], topic_articles, env),
+        "main-summary": MainFlow(["-s", args.source, "-t", args.topic, "--summary", "-k", str(args.top_k)],
+                                 min(args.top_k, topic_articles), env),
+    }
+    selected = args.scenario or list(cases)
+    unknown = set(selected) - set(cases)
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(sorted(unknown))}, choose from {', '.join(cases)}")
+    print(f"stand-in {standin.url}: {args.articles} articles/source, latency {args.latency}s+{args.jitter}s, "
+          f"error rate {args.error_rate}, llm {args.tokens_per_second} tokens/s x {args.llm_slots}")
+    print(f"{'scenario':<15}{'runs':>5}{'articles/s':>12}{'p50 s':>9}{'p99 s':>9}{'peak MiB':>10}"
+          f"{'requests':>10}{'errors':>8}{'llm calls':>11}")
+    results = []
+    for name in selected:
+        result = measure(name, cases[name], args.runs, standin)
+        results.append(result)
+        upstream = result["upstream"]
+        print(f"{name:<15}{result['runs']:>5}{result['articles_per_second']:>12.2f}{result['p50']:>9.3f}"
+              f"{result['p99']:>9.3f}{result['peak_bytes'] / 2 ** 20:>10.1f}"
+              f"{upstream['feed'] + upstream['not_modified'] + upstream['page']:>10.1f}"
+              f"{upstream['errors']:>8.1f}{upstream['llm']:>11.1f}")
+    print("requests, errors and llm calls are per run; peak is the python heap for in-process scenarios "
+          "and max rss for main.py")
+    standin.stop()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
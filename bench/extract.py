@@ -0,0 +1,65 @@
+"""
+正文抽取: 整页 BeautifulSoup 解析 vs 只解析目标节点 (SoupStrainer), 对比 pages/sec 和峰值内存
+fixtures 是按两个站点页面结构 (大段 script/style/nav + 正文) 构造的离线样本, 也可以用 --file 传入抓下来的页面
+python -m bench.extract --runs 50
+"""
+import os
+import time
+import argparse
+import tracemalloc
+from bs4 import BeautifulSoup
+from sources import Bloomberg, Reuters
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+parser = argparse.ArgumentParser(prog="bench.extract", description="html extraction throughput")
+parser.add_argument('--runs', default=50, type=int)
+parser.add_argument('--file', help="extra page as source:path, e.g. reuters:page.html", action="append", default=[])
+
+
+def full_parse_bloomberg(html: str) -> str:
+    soup = BeautifulSoup(html, 'html.parser')
+    article_class = soup.find_all(class_="article-text")
+    if article_class:
+        return article_class[0].get_text()
+    return ""
+
+
+def full_parse_reuters(html: str) -> str:
+    soup = BeautifulSoup(html, 'html.parser')
+    return "\n".join(element.text for element in soup.find_all('p'))
+
+
+def measure(func, html: str, runs: int):
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(html)
+    return runs / (time.perf_counter() - start), peak
+
+
+def main():
+    args = parser.parse_args()
+    cases = {
+        "bloomberg": (full_parse_bloomberg, Bloomberg.extract_content),
+        "reuters": (full_parse_reuters, Reuters.extract_content),
+    }
+    pages = [(source, os.path.join(FIXTURES, f"{source}.html")) for source in cases]
+    pages += [tuple(item.split(":", 1)) for item in args.file]
+    print(f"{'page':<28}{'mode':<8}{'pages/s':>10}{'peak KiB':>10}")
+    for source, path in pages:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        old, new = cases[source]
+        assert old(html) == new(html), f"{path}: extracted text differs"
+        name = f"{source}:{os.path.basename(path)}"
+        for mode, func in (("full", old), ("strain", new)):
+            pages_per_second, peak = measure(func, html, args.runs)
+            print(f"{name:<28}{mode:<8}{pages_per_second:>10.1f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
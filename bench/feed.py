@@ -0,0 +1,74 @@
+"""
+feed 解码和校验: 逐篇 NewsArticle.serialize vs 批量 TypeAdapter, 以及先过滤 topic 再校验
+python -m bench.feed --articles 1000 10000 --runs 5
+"""
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from sources import FeedCache, NewsArticle, gc_paused
+
+parser = argparse.ArgumentParser(prog="bench.feed", description="feed decode/validate throughput")
+parser.add_argument('--articles', nargs="+", type=int, default=[1000, 10000])
+parser.add_argument('--runs', default=5, type=int)
+parser.add_argument('--topic', default="oil")
+
+
+def make_feed(n: int) -> bytes:
+    rng = random.Random(n)
+    words = "market shares investors bank rate inflation growth earnings oil prices bond dollar trade".split()
+    words += [f"word{i}" for i in range(200)]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return json.dumps([{
+        "source": {"id": "reuters", "name": "Reuters"},
+        "title": " ".join(rng.choices(words, k=10)),
+        "description": " ".join(rng.choices(words, k=40)),
+        "publishedAt": (start + timedelta(seconds=i)).isoformat(),
+        "symbols": rng.sample(["AAPL", "MSFT", "TSLA", "NVDA", "AMZN"], k=2),
+        "url": f"https://www.reuters.com/markets/{i}",
+        "id": f"id-{i}",
+    } for i in range(n)]).encode()
+
+
+def per_article(content: bytes, topic: str):
+    articles = [NewsArticle.serialize(**article) for article in json.loads(content)]
+    if topic:
+        return [article for article in articles if topic in article.description.split()]
+    return articles
+
+
+def bulk(content: bytes, topic: str):
+    with gc_paused():
+        items = json.loads(content)
+    feed = FeedCache("", "", items)
+    if topic:
+        return feed.select([i for i, item in enumerate(feed.items) if topic in item["description"].split()])
+    return feed.articles
+
+
+def measure(func, content: bytes, topic: str, runs: int, n: int):
+    tracemalloc.start()
+    count = len(func(content, topic))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(content, topic)
+    return count, n * runs / (time.perf_counter() - start), peak
+
+
+def main():
+    args = parser.parse_args()
+    print(f"{'articles':>9}  {'topic':<6}{'mode':<13}{'kept':>7}{'articles/s':>12}{'peak KiB':>10}")
+    for n in args.articles:
+        content = make_feed(n)
+        for topic in ("", args.topic):
+            for mode, func in (("per-article", per_article), ("bulk", bulk)):
+                count, rate, peak = measure(func, content, topic, args.runs, n)
+                print(f"{n:>9}  {topic or '-':<6}{mode:<13}{count:>7}{rate:>12.0f}{peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
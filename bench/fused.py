@@ -0,0 +1,64 @@
+"""
+对比两段式 (summary -> translate) 和 fused 单次生成的端到端耗时与生成 token 数
+python -m bench.fused -l URL [-l URL ...] --source reuters --runs 3
+"""
+import time
+import argparse
+import statistics
+from models import LLM
+from tools import count_tokens
+
+parser = argparse.ArgumentParser(prog="bench.fused", description="two-stage vs fused summary latency")
+parser.add_argument('-l', "--url", help="article url", action="append", default=[])
+parser.add_argument('-f', "--file", help="local article text file", action="append", default=[])
+parser.add_argument('-s', '--source', help="news's source of the urls", default="reuters")
+parser.add_argument('--model-type', default="Ollama")
+parser.add_argument('--model-id', default="qwen-chat-14B-Q4_0:latest")
+parser.add_argument('--runs', default=3, type=int)
+
+
+def two_stage(llm: LLM, content: str):
+    summary = llm.summary_chain.invoke({"article": content})
+    translation = llm.translate_chain.invoke({"content": summary})
+    return count_tokens(summary) + count_tokens(translation)
+
+
+def fused(llm: LLM, content: str):
+    output = llm.fused_chain.invoke({"article": content})
+    return count_tokens(output)
+
+
+def measure(func, llm: LLM, contents, runs: int):
+    latencies, tokens = [], []
+    for _ in range(runs):
+        for content in contents:
+            start = time.perf_counter()
+            tokens.append(func(llm, content))
+            latencies.append(time.perf_counter() - start)
+    return latencies, tokens
+
+
+def main():
+    args = parser.parse_args()
+    contents = []
+    for path in args.file:
+        with open(path, encoding="utf-8") as f:
+            contents.append(f.read())
+    if args.url:
+        from sources import Bloomberg, Reuters
+        client = Bloomberg() if args.source == "bloomberg" else Reuters()
+        contents.extend(client.get_article_content(url) for url in args.url)
+    contents = [content for content in contents if content]
+    if not contents:
+        parser.error("no article content, give --url or --file")
+    llm = LLM(model_type=args.model_type, model_id=args.model_id)
+    print(f"{len(contents)} articles x {args.runs} runs, model {args.model_type}/{args.model_id}")
+    print(f"{'mode':<10}{'mean s':>10}{'p50 s':>10}{'max s':>10}{'tokens/article':>16}")
+    for name, func in (("two-stage", two_stage), ("fused", fused)):
+        latencies, tokens = measure(func, llm, contents, args.runs)
+        print(f"{name:<10}{statistics.mean(latencies):>10.2f}{statistics.median(latencies):>10.2f}"
+              f"{max(latencies):>10.2f}{statistics.mean(tokens):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
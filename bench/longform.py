@@ -0,0 +1,54 @@
+"""
+长文章摘要: 整篇放进一个 prompt vs map-reduce 分块并发总结, 按文章长度对比延迟和 LLM 调用次数
+替身 LLM 用 --prompt-tokens-per-second 模拟 prompt 处理开销, --llm-slots 模拟模型能同时处理的请求数
+替身的 prompt 开销按 token 线性计算, 真实模型的 attention 是平方增长, 整篇的实际差距会更大
+python -m bench.longform --lengths 20 80 320 --llm-slots 4 --prompt-tokens-per-second 400
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+from bench.server import from_args, options, paragraph
+
+parser = argparse.ArgumentParser(prog="bench.longform", parents=[options], description="long article summary latency")
+parser.add_argument('--lengths', help="article lengths in paragraphs", nargs="+", type=int, default=[20, 80, 320])
+parser.add_argument('--chunk-tokens', default=1500, type=int)
+parser.add_argument('--fused', default=False, action="store_true")
+
+
+def main():
+    args = parser.parse_args()
+    standin = from_args(args).start()
+    # 进程内的 LLM 并发上限和替身模型的 slots 一致
+    os.environ.update(NEWS_CACHE_DIR=tempfile.mkdtemp(prefix="news-bench-"), NEWS_LLM_CONCURRENCY=str(args.llm_slots),
+                      **standin.env())
+
+    from tools import count_tokens, logger
+    from models import get_llm, llm_cache
+
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+    llm = get_llm()
+    rng = random.Random(args.seed)
+    print(f"llm {args.tokens_per_second} tokens/s, prompt {args.prompt_tokens_per_second or 'free'} tokens/s, "
+          f"{args.llm_slots} slots, chunk {args.chunk_tokens} tokens")
+    print(f"{'paragraphs':>10}{'tokens':>8}  {'mode':<11}{'seconds':>9}{'llm calls':>11}{'prompt tokens':>15}")
+    for length in args.lengths:
+        content = "\n".join(paragraph(rng) for _ in range(length))
+        for mode, chunk_tokens in (("single", sys.maxsize), ("map-reduce", args.chunk_tokens)):
+            llm_cache.clear()
+            llm.chunk_tokens = chunk_tokens
+            standin.reset_stats()
+            start = time.perf_counter()
+            llm.generate_summary(content, fused=args.fused)
+            elapsed = time.perf_counter() - start
+            stats = standin.reset_stats()
+            print(f"{length:>10}{count_tokens(content):>8}  {mode:<11}{elapsed:>9.2f}{stats['llm']:>11}"
+                  f"{stats['prompt_tokens']:>15}")
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
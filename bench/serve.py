@@ -0,0 +1,96 @@
+"""
+HTTP 服务 (server.py) 压测: 后端全部是本地替身服务 (bench.server)
+    summary: 同一批 url 的摘要请求并发打进来, 对比 single-flight 合并开和关时上游下载和 LLM 调用次数
+    brief:   并发请求 topic 列表, 看 feed 进程内缓存后的吞吐
+报告 requests/sec、p50/p99 耗时, 以及替身服务实际收到的页面请求和 LLM 调用
+python -m bench.serve --requests 64 --concurrency 16 --urls 4 --tokens-per-second 200
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from bench.e2e import percentile
+from bench.server import from_args, options
+
+parser = argparse.ArgumentParser(prog="bench.serve", parents=[options], description="load test the http api server")
+parser.add_argument('--requests', help="requests per scenario", default=64, type=int)
+parser.add_argument('--concurrency', default=16, type=int)
+parser.add_argument('--urls', help="distinct articles the summary requests spread over", default=4, type=int)
+parser.add_argument('-s', '--source', default="reuters")
+parser.add_argument('-t', '--topic', default="oil")
+parser.add_argument('--llm-concurrency', help="server side llm concurrency", default=2, type=int)
+parser.add_argument('--verbose', help="keep INFO and WARNING logs", default=False, action="store_true")
+
+
+def load(urls, concurrency: int):
+    """
+    并发请求 urls, 返回 (耗时列表, 非 200 个数, 总耗时)
+    """
+    latencies, failures = [], 0
+    lock = threading.Lock()
+
+    def get(url):
+        nonlocal failures
+        start = time.perf_counter()
+        response = requests.get(url, timeout=300)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            failures += response.status_code != 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(get, urls))
+    return latencies, failures, time.perf_counter() - start
+
+
+def main():
+    args = parser.parse_args()
+    standin = from_args(args).start()
+    os.environ.update(NEWS_CACHE_DIR=tempfile.mkdtemp(prefix="news-bench-"), **standin.env())
+
+    from tools import logger
+    from traffic import host_traffic
+    from cache import content_cache
+    from models import llm_cache
+    from sources import News
+    from server import NewsService, make_server
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="ERROR")
+    host_traffic.set_limit(urlsplit(standin.url).netloc, 1000, 1000)
+    article_urls = [f"{standin.url}/{args.source}/{n}" for n in range(args.urls)]
+    print(f"{'scenario':<20}{'requests':>9}{'req/s':>9}{'p50 s':>9}{'p99 s':>9}{'failed':>8}"
+          f"{'pages':>7}{'feeds':>7}{'llm calls':>11}")
+    for name, coalesce, path, queries in (
+        ("summary", True, "/summary", [{"url": url} for url in article_urls]),
+        ("summary-no-coalesce", False, "/summary", [{"url": url} for url in article_urls]),
+        ("brief", True, "/brief", [{"topic": args.topic}]),
+        ("brief-no-coalesce", False, "/brief", [{"topic": args.topic}]),
+    ):
+        News._feeds.clear()
+        content_cache.clear()
+        llm_cache.clear()
+        httpd = make_server(NewsService(llm_concurrency=args.llm_concurrency, coalesce=coalesce), port=0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{httpd.server_address[1]}{path}?"
+        urls = [base + urlencode(dict(queries[i % len(queries)], source=args.source)) for i in range(args.requests)]
+        standin.reset_stats()
+        latencies, failures, elapsed = load(urls, args.concurrency)
+        stats = standin.reset_stats()
+        httpd.shutdown()
+        httpd.server_close()
+        print(f"{name:<20}{len(latencies):>9}{len(latencies) / elapsed:>9.1f}{percentile(latencies, 50):>9.3f}"
+              f"{percentile(latencies, 99):>9.3f}{failures:>8}{stats['page']:>7}"
+              f"{stats['feed'] + stats['not_modified']:>7}{stats['llm']:>11}")
+    standin.stop()
+
+
+if __name__ == "__main__":
+    main()
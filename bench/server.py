@@ -0,0 +1,345 @@
+"""
+本地替身服务, 端到端 benchmark 不依赖外网和真实模型:
+    GET  /landing-page/articles-{source}.json   newsfilter feed, 支持 ETag / If-None-Match
+    GET  /{source}/{n}                           文章页面, 按 bloomberg / neuters.de 的页面结构生成
+    POST /api/generate                           Ollama 兼容的流式生成, 按 tokens/sec 逐个吐 token
+    GET  /stats                                  各类请求计数
+feed 和页面请求按 --latency/--jitter 加延迟, 按 --error-rate 随机返回 503; 也可以用 --feed / --page 回放抓下来的文件
+python -m bench.server --port 8765 --latency 0.05 --error-rate 0.1 --tokens-per-second 30
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from tools import count_tokens
+
+WORDS = ("market shares investors bank rate inflation growth earnings oil prices bond dollar trade yields "
+         "central economy tariffs quarter billion percent forecast analysts demand supply crude exports "
+         "policy officials said would could since against while after before record higher lower").split()
+WORDS += [f"term{i}" for i in range(200)]
+CHINESE = "市场股票投资者银行利率通胀增长收益石油价格债券美元贸易经济关税季度预测分析需求供应出口政策官员表示"
+NAV = ["World", "Business", "Markets", "Sustainability", "Legal", "Breakingviews", "Technology", "Investigations"]
+SOURCES = ("bloomberg", "reuters")
+
+feed_pattern = re.compile(r"^/landing-page/articles-(?P<source>\w+)\.json$")
+page_pattern = re.compile(r"^/(?P<source>\w+)/(?P<n>\d+)$")
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choices(WORDS, k=n)).capitalize() + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5)))
+
+
+def boilerplate(rng: random.Random) -> str:
+    # 和真实页面一样带大段 style/script, 让解析开销接近真实
+    style = "".join(f".c{i}{{margin:{i}px;padding:{i % 7}px}}" for i in range(300))
+    data = ",".join(f'"k{i}": "{sentence(rng, 12)}"' for i in range(60))
+    return f"<style>{style}</style><script>window.__DATA__ = {{{data}}};</script>"
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class StandIn:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, articles: int = 200, paragraphs: int = 20,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 tokens_per_second: float = 50.0, prompt_tokens_per_second: float = 0.0,
+                 output_tokens: int = 80, llm_slots: int = 1, feeds: Dict[str, str] = None,
+                 pages: Dict[str, str] = None, seed: int = 0) -> None:
+        """
+        prompt_tokens_per_second 模拟 prompt 处理耗时, 0 表示不计; llm_slots 是模型能同时处理的请求数
+        feeds / pages 是 source -> 文件路径, 回放抓下来的 feed json 和页面
+        """
+        self.articles = articles
+        self.paragraphs = paragraphs
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.output_tokens = output_tokens
+        self.seed = seed
+        self._recorded_feeds = feeds or {}
+        self._recorded_pages = pages or {}
+        self._llm_slots = threading.Semaphore(llm_slots)
+        self._feeds: Dict[str, tuple] = {}
+        self._pages: Dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"feed": 0, "not_modified": 0, "page": 0, "llm": 0, "errors": 0,
+                                      "prompt_tokens": 0, "output_tokens": 0}
+        self.httpd = StandInServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """
+        把 main.py / sources 指向替身服务的环境变量
+        """
+        return {
+            "NEWS_FEED_URL": self.url + "/landing-page/articles-{source}.json",
+            "NEWS_MODEL_TYPE": "Ollama",
+            "NEWS_MODEL_BASE_URL": self.url,
+        }
+
+    def start(self) -> "StandIn":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    def reset_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+            for key in self.stats:
+                self.stats[key] = 0
+        return stats
+
+    def feed(self, source: str) -> tuple:
+        """
+        返回 (body, etag), 按 source 生成一次后复用
+        """
+        with self._lock:
+            if source not in self._feeds:
+                items = self._load_feed(source) if source in self._recorded_feeds else self._make_feed(source)
+                for n, item in enumerate(items):
+                    item["url"] = f"{self.url}/{source}/{n}"
+                body = json.dumps(items).encode()
+                self._feeds[source] = (body, '"%s"' % hashlib.sha1(body).hexdigest())
+            return self._feeds[source]
+
+    def _load_feed(self, source: str) -> List[dict]:
+        with open(self._recorded_feeds[source], encoding="utf-8") as f:
+            return json.load(f)
+
+    def _make_feed(self, source: str) -> List[dict]:
+        rng = random.Random(f"{self.seed}:{source}")
+        now = datetime.now(timezone.utc)
+        return [{
+            "source": {"id": source, "name": source.title()},
+            "title": sentence(rng, 10),
+            "description": " ".join(sentence(rng, 12) for _ in range(3)),
+            "publishedAt": (now - timedelta(minutes=7 * n + rng.randint(0, 6))).isoformat(),
+            "symbols": rng.sample(["AAPL", "MSFT", "TSLA", "NVDA", "AMZN", "XOM", "JPM"], k=2),
+            "url": "",
+            "id": f"{source}-{n}",
+        } for n in range(self.articles)]
+
+    def page(self, source: str, n: int) -> bytes:
+        key = (source, n)
+        with self._lock:
+            if key not in self._pages:
+                if source in self._recorded_pages:
+                    with open(self._recorded_pages[source], "rb") as f:
+                        self._pages[key] = f.read()
+                else:
+                    self._pages[key] = self._make_page(source, n).encode()
+            return self._pages[key]
+
+    def _make_page(self, source: str, n: int) -> str:
+        rng = random.Random(f"{self.seed}:{source}:{n}")
+        title = sentence(rng, 10)
+        body = "".join(f"<p>{paragraph(rng)}</p>" for _ in range(self.paragraphs))
+        head = f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title>{boilerplate(rng)}</head>'
+        if source == "bloomberg":
+            nav = "".join(f'<li><a href="/{item.lower()}">{item}</a></li>' for item in NAV)
+            return (f"{head}<body><nav><ul>{nav}</ul></nav><main><h1>{title}</h1>"
+                    f'<div class="article-text body-copy">{body}</div>'
+                    f'<aside><a href="/news/{n + 1}">{sentence(rng, 8)}</a></aside></main>'
+                    f"<footer>Terms of Service</footer></body></html>")
+        # neuters.de: 导航、署名、正文、记者和免责声明都是 <p>
+        nav = " · ".join(f'<a href="/{item.lower()}">{item}</a>' for item in NAV)
+        return (f"{head}<body><nav><p>{nav}</p></nav><article><h1>{title}</h1>"
+                f'<p class="byline">By Staff Reporter · {n} minutes ago</p>{body}'
+                f"<p>Reporting by Staff Reporter; Editing by Desk Editor</p>"
+                f"<p>Our Standards: The Thomson Reuters Trust Principles.</p></article>"
+                f"<footer><p>neuters is a privacy-friendly Reuters front-end.</p></footer></body></html>")
+
+    def completion(self, prompt: str) -> List[str]:
+        """
+        假模型的输出 token, 同一个 prompt 输出相同; fused prompt 按 SUMMARY/TRANSLATION 格式输出
+        """
+        rng = random.Random(prompt)
+        english = [" " + word for word in rng.choices(WORDS, k=self.output_tokens)]
+        chinese = rng.choices(CHINESE, k=self.output_tokens)
+        if "TRANSLATION:" in prompt:
+            half = self.output_tokens // 2
+            return ["SUMMARY:\n"] + english[:half] + ["\nTRANSLATION:\n"] + chinese[:half]
+        if "Chinese-English translation" in prompt:
+            return chinese
+        return english
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def upstream(self) -> bool:
+                """
+                模拟上游延迟和随机错误, 返回 False 时已经回了 503
+                """
+                delay = standin.latency + (random.uniform(0, standin.jitter) if standin.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if standin.error_rate and random.random() < standin.error_rate:
+                    standin.count("errors")
+                    self.send_body(503, b"stand-in error", "text/plain")
+                    return False
+                return True
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    with standin._lock:
+                        body = json.dumps(standin.stats).encode()
+                    return self.send_body(200, body, "application/json")
+                match = feed_pattern.match(self.path)
+                if match:
+                    if not self.upstream():
+                        return
+                    body, etag = standin.feed(match.group("source"))
+                    if self.headers.get("If-None-Match") == etag:
+                        standin.count("not_modified")
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    standin.count("feed")
+                    return self.send_body(200, body, "application/json", {"ETag": etag})
+                match = page_pattern.match(self.path)
+                if match and match.group("source") in SOURCES:
+                    if not self.upstream():
+                        return
+                    standin.count("page")
+                    return self.send_body(200, standin.page(match.group("source"), int(match.group("n"))),
+                                          "text/html; charset=utf-8")
+                self.send_body(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                if self.path != "/api/generate":
+                    return self.send_body(404, b"not found", "text/plain")
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                prompt = request.get("prompt") or ""
+                model = request.get("model", "")
+                prompt_tokens = count_tokens(prompt)
+                standin.count("llm")
+                standin.count("prompt_tokens", prompt_tokens)
+                with standin._llm_slots:
+                    if standin.prompt_tokens_per_second:
+                        time.sleep(prompt_tokens / standin.prompt_tokens_per_second)
+                    tokens = standin.completion(prompt)
+                    standin.count("output_tokens", len(tokens))
+                    if request.get("stream") is False:
+                        time.sleep(len(tokens) / standin.tokens_per_second)
+                        return self.send_body(200, json.dumps({"model": model, "response": "".join(tokens),
+                                                               "done": True}).encode(), "application/json")
+                    self.stream(model, tokens, prompt_tokens)
+
+            def stream(self, model: str, tokens: List[str], prompt_tokens: int):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                start = time.monotonic()
+                for k, token in enumerate(tokens, 1):
+                    # 按绝对时间对齐, sleep 的误差不会累积
+                    wait = start + k / standin.tokens_per_second - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                    self.chunk({"model": model, "response": token, "done": False})
+                self.chunk({"model": model, "response": "", "done": True, "prompt_eval_count": prompt_tokens,
+                            "eval_count": len(tokens), "eval_duration": int((time.monotonic() - start) * 1e9)})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def chunk(self, data: dict):
+                line = json.dumps(data, ensure_ascii=False).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+
+        return Handler
+
+
+def parse_files(values: List[str]) -> Dict[str, str]:
+    return dict(value.split(":", 1) for value in values)
+
+
+# 替身服务的参数, bench.e2e 也复用
+options = argparse.ArgumentParser(add_help=False)
+options.add_argument('--articles', help="articles per generated feed", default=200, type=int)
+options.add_argument('--paragraphs', help="paragraphs per generated article", default=20, type=int)
+options.add_argument('--latency', help="seconds added to every feed/page request", default=0.0, type=float)
+options.add_argument('--jitter', help="extra uniform random seconds on top of --latency", default=0.0, type=float)
+options.add_argument('--error-rate', help="fraction of feed/page requests answered with 503", default=0.0, type=float)
+options.add_argument('--tokens-per-second', help="fake llm generation speed", default=50.0, type=float)
+options.add_argument('--prompt-tokens-per-second', help="fake llm prompt processing speed, 0 is free", default=0.0, type=float)
+options.add_argument('--output-tokens', help="tokens per fake llm reply", default=80, type=int)
+options.add_argument('--llm-slots', help="concurrent generations the fake llm serves", default=1, type=int)
+options.add_argument('--feed', help="replay a recorded feed as source:path.json", action="append", default=[])
+options.add_argument('--page', help="serve a recorded page for every article of source:path.html", action="append", default=[])
+options.add_argument('--seed', default=0, type=int)
+
+parser = argparse.ArgumentParser(prog="bench.server", parents=[options],
+                                 description="local stand-in for newsfilter, article pages and ollama")
+parser.add_argument('--host', default="127.0.0.1")
+parser.add_argument('--port', default=8765, type=int)
+
+
+def from_args(args, host: str = "127.0.0.1", port: int = 0) -> StandIn:
+    return StandIn(host=host, port=port, articles=args.articles, paragraphs=args.paragraphs,
+                   latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   tokens_per_second=args.tokens_per_second,
+                   prompt_tokens_per_second=args.prompt_tokens_per_second, output_tokens=args.output_tokens,
+                   llm_slots=args.llm_slots, feeds=parse_files(args.feed), pages=parse_files(args.page),
+                   seed=args.seed)
+
+
+def main():
+    args = parser.parse_args()
+    standin = from_args(args, args.host, args.port)
+    for name, value in standin.env().items():
+        print(f"export {name}='{value}'")
+    try:
+        standin.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+CLI 启动耗时: import 耗时, 以及 main.py 列 brief 时打印出第一篇文章的耗时
+python -m bench.startup --source reuters --runs 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(prog="bench.startup", description="cli startup time")
+parser.add_argument('-s', '--source', help="news's source", default="reuters")
+parser.add_argument('--runs', default=5, type=int)
+parser.add_argument('--no-fetch', help="only measure import time", default=False, action="store_true")
+
+
+def import_time() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def first_article_time(source: str) -> float:
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "main.py", "-s", source], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    elapsed = float("nan")
+    for line in proc.stdout:
+        if line.startswith("title:"):
+            elapsed = time.perf_counter() - start
+            break
+    proc.kill()
+    proc.wait()
+    return elapsed
+
+
+def report(name: str, samples):
+    print(f"{name:<16}{statistics.median(samples):>10.3f}{min(samples):>10.3f}{max(samples):>10.3f}")
+
+
+def main():
+    args = parser.parse_args()
+    print(f"{'':<16}{'p50 s':>10}{'min s':>10}{'max s':>10}")
+    report("import main", [import_time() for _ in range(args.runs)])
+    if not args.no_fetch:
+        report("first article", [first_article_time(args.source) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+多 topic 过滤: 每个 topic 一个正则逐篇扫描 vs TopicMatcher 单遍扫描
+python -m bench.topics --topics 10 100 1000 --articles 200 2000
+"""
+import re
+import time
+import random
+import argparse
+from matcher import TopicMatcher
+
+parser = argparse.ArgumentParser(prog="bench.topics", description="multi-topic matching throughput")
+parser.add_argument('--topics', nargs="+", type=int, default=[10, 100, 1000])
+parser.add_argument('--articles', nargs="+", type=int, default=[200, 2000])
+parser.add_argument('--seed', type=int, default=0)
+
+
+def make_words(rng: random.Random, n: int):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(n)]
+
+
+def make_corpus(rng: random.Random, vocabulary, n_articles: int):
+    return [(" ".join(rng.choices(vocabulary, k=12)), " ".join(rng.choices(vocabulary, k=50)))
+            for _ in range(n_articles)]
+
+
+def per_topic_regex(topics, articles):
+    result = {}
+    for topic in topics:
+        pattern = re.compile(f"\\b{re.escape(topic.lower())}\\b", re.IGNORECASE)
+        result[topic] = [i for i, (title, description) in enumerate(articles)
+                         if pattern.search(title) or pattern.search(description)]
+    return result
+
+
+def single_pass(topics, articles):
+    matcher = TopicMatcher(topics)
+    result = {topic: [] for topic in matcher.topics}
+    for i, (title, description) in enumerate(articles):
+        for index in matcher.match(f"{title}\n{description}"):
+            result[matcher.topics[index]].append(i)
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    vocabulary = make_words(rng, 5000)
+    print(f"{'topics':>8}{'articles':>10}{'regex s':>10}{'matcher s':>12}{'speedup':>10}")
+    for n_articles in args.articles:
+        articles = make_corpus(rng, vocabulary, n_articles)
+        for n_topics in args.topics:
+            topics = rng.sample(vocabulary, n_topics)
+            expected, regex_seconds = timed(per_topic_regex, topics, articles)
+            result, matcher_seconds = timed(single_pass, topics, articles)
+            assert result == expected
+            print(f"{n_topics:>8}{n_articles:>10}{regex_seconds:>10.3f}{matcher_seconds:>12.3f}"
+                  f"{regex_seconds / matcher_seconds:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from tools import logger
+from metrics import metrics
+
+CACHE_DIR = os.environ.get("NEWS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "news"))
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "cmpid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url: str) -> str:
+    """
+    同一篇文章的不同写法归一成一个 key: 去掉 fragment、追踪参数, query 排序
+    """
+    parts = urlsplit(url.strip())
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    ]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(sorted(query)), ""))
+
+
+class DiskCache:
+    """
+    基于 sqlite 的 key-value 缓存
+    ttl 秒后过期(None 为不过期), 超过 max_entries 时按访问时间淘汰最久未用的
+    """
+
+    def __init__(self, name: str, ttl: Optional[float] = 24 * 3600, max_entries: int = 10000,
+                 cache_dir: str = CACHE_DIR) -> None:
+        self.name = name
+        self.path = os.path.join(cache_dir, f"{name}.db")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed_at ON cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.inc("news_cache_requests_total", cache=self.name, result="miss")
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                self.misses += 1
+                metrics.inc("news_cache_requests_total", cache=self.name, result="expired")
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            metrics.inc("news_cache_requests_total", cache=self.name, result="hit")
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count}
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info("{} cache: {} hits, {} misses, {} entries".format(
+            os.path.basename(self.path), stats["hits"], stats["misses"], stats["entries"]))
+
+
+# 存抽取后的正文而不是原始 html
+content_cache = DiskCache(
+    "content",
+    ttl=float(os.environ.get("NEWS_CONTENT_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.environ.get("NEWS_CONTENT_CACHE_SIZE", 5000)),
+)
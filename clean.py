@@ -0,0 +1,78 @@
+"""
+正文送进 LLM 之前的清洗: 去掉导航、署名、图片说明、记者/编辑、免责声明和页脚等模板段落, 重复段落和多余空白
+本地模型处理 prompt 的时间随输入 token 线性增长, 这些段落不影响摘要, 清掉直接省延迟
+"""
+import re
+from typing import List
+
+_spaces = re.compile(r"[^\S\n]+")
+# 没有字母也没有数字的行 (分隔线、孤立的符号); 只有数字的表格行要保留
+_alnum = re.compile(r"[^\W_]")
+_letters = re.compile(r"[^\W\d_]")
+# 导航栏: 用 · | • 隔开的一串短链接文字
+_nav_separator = re.compile(r"\s+[·|•]\s+")
+# 大写开头的人名或地名, 最多 4 个词
+_name = r"[A-Z][\w.'’-]*( [A-Z][\w.'’-]*){0,3}"
+# 署名后的时间: "3 minutes ago" / "10:32 AM EDT" / "May 3, 2024" / "2024-05-03"
+_timestamp = (r"(Updated )?(\d+ (minutes?|hours?|days?) ago|\d{1,2}:\d{2}( ?[AP]M)?( [A-Z]{2,4})?"
+              r"|[A-Z][a-z]{2,8}\.? \d{1,2}, \d{4}|\d{4}-\d{2}-\d{2})")
+# 署名: "By Staff Reporter · 3 minutes ago" / "By Jane Doe and John Roe", 区分大小写, 避免误删 "By contrast, ..."
+_byline = re.compile(rf"^By {_name}((,| and|, and) {_name})*(\s+[·|•-]\s+{_timestamp}( [A-Z]{{2,4}})?)?$")
+# 记者和编辑: "Reporting by Jane Doe in London; Editing by Desk Editor", 名字后面只能是 ; 或行尾
+_credit = re.compile(rf"^(?i:(additional )?(reporting|writing|editing|compiling|graphics|research) by) "
+                     rf"{_name}( in {_name})?((,| and|, and) {_name}( in {_name})?)*\.?(;|$)")
+# 图片署名在段尾: "... REUTERS/Nick Oxford/File Photo", 区分大小写, 不会误删正文里的 "Reuters/Ipsos poll"
+_photo_credit = re.compile(r"\(?\bREUTERS/[A-Z][\w.'’-]*( [A-Z][\w.'’-]*)*(/[A-Z][\w.'’-]*( [A-Z][\w.'’-]*)*)*\)?\s*$")
+
+# 整段都是模板的段落, 按段首或整段匹配
+boilerplate_patterns = [re.compile(pattern, re.I) for pattern in (
+    r"^(updated|published|last updated)\b.{0,40}(\d{1,2}:\d{2}|\bago)\b.{0,10}$",
+    r"^\d+\s+(minutes?|hours?|days?) ago$",
+    r"^our standards:",
+    r"thomson reuters trust principles",
+    # 图片说明
+    r"^(file )?photo:",
+    r"^(image|picture|photograph|video)( credit)?:",
+    r"^\(?(photo|image)s? (by|courtesy of|credit)\b",
+    r"\b(getty images|bloomberg via getty)\s*$",
+    # 推广和页脚
+    r"^(sign up|subscribe)\b.{0,60}\b(newsletters?|briefing|here|now|today)\W*$",
+    r"^(read more|related|see also|more from [\w ]{1,30})\s*:",
+    r"^(click here|follow us)\b",
+    r"^(©|copyright|\(c\))\s*\d{4}",
+    r"^all quotes delayed\b",
+    r"^terms of service$",
+    r"privacy-friendly reuters front-end",
+)]
+
+
+def is_boilerplate(paragraph: str) -> bool:
+    if not _alnum.search(paragraph):
+        return True
+    parts = _nav_separator.split(paragraph)
+    if len(parts) >= 4 and all(len(part.split()) <= 3 and _letters.search(part) for part in parts):
+        return True
+    if _byline.match(paragraph) or _credit.match(paragraph) or _photo_credit.search(paragraph):
+        return True
+    return any(pattern.search(paragraph) for pattern in boilerplate_patterns)
+
+
+def clean_paragraphs(text: str) -> List[str]:
+    """
+    按行拆成段落, 合并空白, 丢掉模板段落和重复段落 (忽略大小写和空白, 保留第一次出现)
+    """
+    paragraphs, seen = [], set()
+    for line in text.splitlines():
+        paragraph = _spaces.sub(" ", line).strip()
+        if not paragraph or is_boilerplate(paragraph):
+            continue
+        key = paragraph.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    return paragraphs
+
+
+def clean_content(text: str) -> str:
+    return "\n".join(clean_paragraphs(text))
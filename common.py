@@ -1 +1,11 @@
-OK, ERR = 1, 0
\ No newline at end of file
+from datetime import datetime, timezone
+
+# FATAL: 不可重试的错误, 如 404、熔断打开
+OK, ERR, FATAL = 1, 0, -1
+
+
+def to_utc(value: datetime) -> datetime:
+    # 没有时区的按 UTC 处理, 不随机器所在时区变化
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
@@ -0,0 +1,74 @@
+import re
+import random
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_word_pattern = re.compile(r"\w+")
+
+
+class DuplicateIndex:
+    """
+    MinHash + LSH 近似去重
+    文本切成 shingle_size 个词一组的 shingle, 用 num_perm 个哈希函数的最小值作为签名
+    签名分成 bands 段分桶, 同桶的候选再用签名估算 Jaccard, 不低于 threshold 视为同一篇
+    """
+
+    def __init__(self, shingle_size: int = 3, num_perm: int = 64, bands: int = 16, threshold: float = 0.5,
+                 seed: int = 1) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._buckets: List[Dict[Tuple[int, ...], List[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[Hashable, Tuple[int, ...]] = {}
+
+    def shingles(self, text: str) -> Set[str]:
+        words = _word_pattern.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [hash(shingle) & _MAX_HASH for shingle in self.shingles(text)]
+        if not hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH for a, b in self._perms)
+
+    @staticmethod
+    def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+    def find(self, text: str) -> Optional[Hashable]:
+        return self._find(self.signature(text))
+
+    def _find(self, signature: Tuple[int, ...]) -> Optional[Hashable]:
+        best, best_score = None, self.threshold
+        seen = set()
+        for band, buckets in enumerate(self._buckets):
+            for key in buckets.get(signature[band * self.rows:(band + 1) * self.rows], ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = self.similarity(signature, self._signatures[key])
+                if score >= best_score:
+                    best, best_score = key, score
+        return best
+
+    def add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """
+        已有近似重复时返回那一篇的 key, 不加入索引; 否则加入索引并返回 None
+        """
+        signature = self.signature(text)
+        duplicate = self._find(signature)
+        if duplicate is not None:
+            return duplicate
+        self._signatures[key] = signature
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(signature[band * self.rows:(band + 1) * self.rows], []).append(key)
+        return None
@@ -0,0 +1,68 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple, Union
+from common import to_utc
+
+if TYPE_CHECKING:
+    from sources import NewsArticle
+
+
+class SymbolIndex:
+    """
+    symbol -> 文章 的倒排索引, 每个 symbol 下按发布时间排序, 时间范围查询用二分
+    按 article.id 去重, 可以随着 feed 更新不断 add
+    """
+
+    def __init__(self) -> None:
+        self._articles: Dict[str, "NewsArticle"] = {}
+        self._postings: Dict[str, List[Tuple[float, str]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def add(self, articles: Iterable["NewsArticle"]) -> int:
+        """
+        返回新加入的文章数
+        """
+        added = 0
+        with self._lock:
+            for article in articles:
+                if article.id in self._articles:
+                    continue
+                self._articles[article.id] = article
+                published = article.publishedAt.timestamp()
+                for symbol in {symbol.upper() for symbol in article.symbols}:
+                    insort(self._postings.setdefault(symbol, []), (published, article.id))
+                added += 1
+        return added
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return sorted(self._postings)
+
+    def query(self, symbols: Union[str, Iterable[str]], start: datetime = None,
+              end: datetime = None) -> List["NewsArticle"]:
+        """
+        查询一个或多个 symbol 在 [start, end] 内的文章, 按发布时间倒序
+        start / end 没有时区时按 UTC, 和归档一致
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        low = (to_utc(start).timestamp(),) if start else None
+        high = (to_utc(end).timestamp(), "\uffff") if end else None
+        hits: Dict[str, float] = {}
+        with self._lock:
+            for symbol in symbols:
+                postings = self._postings.get(symbol.upper())
+                if not postings:
+                    continue
+                lo = bisect_left(postings, low) if low else 0
+                hi = bisect_right(postings, high) if high else len(postings)
+                for published, article_id in postings[lo:hi]:
+                    hits[article_id] = published
+            return [self._articles[article_id] for article_id in sorted(hits, key=hits.get, reverse=True)]
+
+
+symbol_index = SymbolIndex()
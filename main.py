@@ -1,41 +1,187 @@
+import sys
+import atexit
+import sqlite3
 import argparse
-from models import llm
-from tools import text_output
-from sources import Bloomberg, Reuters, sources
+from datetime import datetime
+from models import configure_llm, get_llm, llm_cache
+from cache import content_cache
+from metrics import metrics
+from itertools import islice
+from tools import ndjson_output, stream_output, text_output
+from aggregate import fetch_all
+from index import symbol_index
+from sources import (ArticleRecord, brief_records, print_article, print_briefs, source_classes, sources,
+                     summarize, summarize_iter)
 
 parser = argparse.ArgumentParser(
     prog='get latest news.',
     description=f'get latest news from {",".join(sources)}')
 parser.add_argument('-t', '--topic', help="your interest topic", default="")
-parser.add_argument('-s', '--source', help="news's source", default="bloomberg")
+parser.add_argument('-s', '--source', help="news's source, or all", default="bloomberg")
 parser.add_argument('-l', "--url", help="article url, to get whole content", default="")
 parser.add_argument('--summary', help="summary article by llm", default=False, action="store_true")
+parser.add_argument('--no-cache', help="ignore cached article content and llm results", default=False, action="store_true")
+parser.add_argument('--fused', help="summary and translate in one llm call", default=False, action="store_true")
+parser.add_argument('--stream', help="print llm tokens as they are generated", default=False, action="store_true")
+parser.add_argument('--no-dedup', help="summary near-duplicate stories separately", default=False, action="store_true")
+parser.add_argument('--translate', help="translate the title and brief", default=False, action="store_true")
+parser.add_argument('-k', '--top-k', help="number of articles to summary", default=3, type=int)
+parser.add_argument('--symbols', help="comma separated tickers, list their news from all sources", default="")
+parser.add_argument('--since', help="with --symbols, only news published after this iso time, UTC unless it has an offset", default=None, type=datetime.fromisoformat)
+parser.add_argument('--until', help="with --symbols, only news published before this iso time, UTC unless it has an offset", default=None, type=datetime.fromisoformat)
+parser.add_argument('--watch', help="keep polling all sources and print only new articles", default=False, action="store_true")
+parser.add_argument('--interval', help="with --watch, poll interval in seconds for every source", default=None, type=float)
+parser.add_argument('--model-type', help="llm type, Ollama or OpenAI", default=None)
+parser.add_argument('--model-id', help="llm model id", default=None)
+parser.add_argument('--model-url', help="llm server base url, e.g. http://localhost:11434", default=None)
+parser.add_argument('--llm-concurrency', help="max llm generations running at once in this process, default $NEWS_LLM_CONCURRENCY or 2",
+                    default=None, type=int)
+parser.add_argument('--format', help="text for reading, ndjson for one json record per line as soon as it is ready",
+                    choices=["text", "ndjson"], default="text")
+parser.add_argument('--serve', help="run the http api server instead, see server.py", default=False, action="store_true")
+parser.add_argument('--host', help="with --serve, address to listen on", default="127.0.0.1")
+parser.add_argument('--port', help="with --serve, port to listen on", default=8000, type=int)
+parser.add_argument('--profile', help="report per-stage timings at exit, to stderr or a .json / .prom (prometheus textfile) path",
+                    nargs="?", const="-", default=None)
+
+search_parser = argparse.ArgumentParser(
+    prog='main.py search',
+    description='full-text search over archived titles, briefs and article bodies')
+search_parser.add_argument('query', help='fts5 query, e.g. "rate cut", oil NOT opec, infla*, title:fed', nargs="?", default="")
+search_parser.add_argument('-s', '--source', help="only this source", default=None)
+search_parser.add_argument('-n', '--limit', help="max results", default=20, type=int)
+search_parser.add_argument('--reindex', help="rebuild the index from the local archive first", default=False, action="store_true")
+
+
+def log_cache_stats():
+    """
+    进程结束时输出这次用到的缓存的命中情况
+    """
+    for cache in (content_cache, llm_cache):
+        if cache.hits or cache.misses:
+            cache.log_stats()
+
+
+def search(argv):
+    from archive import archive
+    from search import search_index
+
+    args = search_parser.parse_args(argv)
+    if args.reindex:
+        search_index.reindex(archive)
+    if not args.query:
+        return
+    try:
+        results = search_index.search(args.query, limit=args.limit, source=args.source)
+    except sqlite3.OperationalError as e:
+        search_parser.error(f"bad query {args.query!r}: {e}")
+    for result in results:
+        print(f"title: {result['title']}")
+        print(f"url: {result['url']}")
+        print(f"published: {result['published_at']}  source: {result['source']}")
+        text_output(result["snippet"])
+        print("-" * 30)
+
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ["search"]:
+        search(sys.argv[2:])
+        raise SystemExit
     args = parser.parse_args()
-    if args.source == "bloomberg":
-        client = Bloomberg()
-        if args.url:
-            article_content = client.get_article_content(args.url)
-            print("-" * 100)
-            text_output(article_content)
-            print("-" * 100)
-            if args.summary:
-                text_output(llm.generate_summary(article_content))
-                print("-" * 100)
+    if args.source != "all" and args.source not in source_classes:
+        raise NotImplementedError(f"{args.source} is not implemented.")
+    if args.translate:
+        from NLLB import check_dependencies
+
+        try:
+            check_dependencies()
+        except ImportError as e:
+            parser.error(str(e))
+    configure_llm(args.model_type, args.model_id, args.model_url, args.llm_concurrency)
+    atexit.register(log_cache_stats)
+    if args.profile:
+        metrics.enable()
+        atexit.register(metrics.dump, args.profile)
+    if args.serve:
+        from server import serve
+
+        serve(args.host, args.port)
+        raise SystemExit
+    ndjson = args.format == "ndjson"
+    if ndjson and args.stream:
+        # token 流会打乱 ndjson, 记录本身已经是逐条输出的
+        args.stream = False
+    if args.symbols:
+        # 拉取所有 source, 文章会加入 symbol_index
+        list(fetch_all())
+        articles = symbol_index.query([symbol.strip() for symbol in args.symbols.split(",")], start=args.since, end=args.until)
+        if ndjson:
+            ndjson_output(ArticleRecord(article=article) for article in articles)
         else:
-            client.get_brief(args.topic)
-    elif args.source == "reuters":
-        client = Reuters()
-        if args.url:
-            article_content = client.get_article_content(args.url)
-            print("-" * 100)
-            text_output(article_content)
-            print("-" * 100)
+            for article in articles:
+                print_article(article)
+        raise SystemExit
+    if args.watch:
+        from watch import Watcher
+
+        def on_new(client, articles):
+            if ndjson:
+                ndjson_output(brief_records(articles))
+                if args.summary:
+                    ndjson_output(summarize_iter([(client, article) for article in articles[:args.top_k]],
+                                                 fused=args.fused, dedup=not args.no_dedup, ordered=False,
+                                                 use_cache=not args.no_cache))
+                return
+            for article in articles:
+                print_article(article)
             if args.summary:
-                text_output(llm.generate_summary(article_content))
-                print("-" * 100)
+                client.summarize_articles(articles[:args.top_k], fused=args.fused, stream=args.stream,
+                                         dedup=not args.no_dedup, use_cache=not args.no_cache)
+
+        clients = {cls(): args.interval or cls.poll_interval for cls in source_classes.values()}
+        Watcher(clients, on_new, topic=args.topic).run()
+        raise SystemExit
+    if args.source == "all":
+        if args.url:
+            parser.error("--url needs a specific --source")
+        items = fetch_all(args.topic)
+        if args.summary and ndjson:
+            ndjson_output(summarize_iter(islice(items, args.top_k), fused=args.fused, dedup=not args.no_dedup,
+                                         ordered=False, use_cache=not args.no_cache))
+        elif args.summary:
+            summarize(islice(items, args.top_k), fused=args.fused, stream=args.stream, dedup=not args.no_dedup,
+                      use_cache=not args.no_cache)
+        elif ndjson:
+            ndjson_output(brief_records((article for _, article in items), translate=args.translate))
         else:
-            client.get_brief(args.topic)
+            print_briefs((article for _, article in items), translate=args.translate)
+        raise SystemExit
+    client = source_classes[args.source]()
+    if args.url:
+        article_content = client.get_article_content(args.url, use_cache=not args.no_cache)
+        if ndjson:
+            record = {"url": args.url, "content": article_content}
+            if args.summary and article_content:
+                record["summary"] = get_llm().generate_summary(article_content, use_cache=not args.no_cache,
+                                                               fused=args.fused)
+            ndjson_output([record])
+            raise SystemExit
+        print("-" * 100)
+        text_output(article_content)
+        print("-" * 100)
+        if args.summary:
+            if args.stream:
+                stream_output(get_llm().stream_summary(article_content, use_cache=not args.no_cache, fused=args.fused))
+            else:
+                text_output(get_llm().generate_summary(article_content, use_cache=not args.no_cache, fused=args.fused))
+            print("-" * 100)
+    elif args.summary and ndjson:
+        ndjson_output(client.iter_summaries(args.topic, top_k=args.top_k, fused=args.fused,
+                                            dedup=not args.no_dedup, ordered=False, use_cache=not args.no_cache))
+    elif args.summary:
+        client.get_summary(args.topic, top_k=args.top_k, fused=args.fused, stream=args.stream,
+                           dedup=not args.no_dedup, use_cache=not args.no_cache)
+    elif ndjson:
+        ndjson_output(client.iter_briefs(args.topic, translate=args.translate))
     else:
-        raise NotImplemented(f"{args.source} is not implemented.")
+        client.get_brief(args.topic, translate=args.translate)
@@ -0,0 +1,76 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class TopicMatcher:
+    """
+    Aho-Corasick 自动机, 扫描一遍文本就能找出命中的所有 topic
+    不区分大小写, topic 首尾是字母数字时要求落在单词边界上 (和 \\b 一致)
+    """
+
+    def __init__(self, topics: Iterable[str]) -> None:
+        self.topics: List[str] = list(dict.fromkeys(topic.strip() for topic in topics if topic.strip()))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._patterns = [topic.lower() for topic in self.topics]
+        for index, pattern in enumerate(self._patterns):
+            self._add(pattern, index)
+        self._build()
+
+    def _add(self, pattern: str, index: int) -> None:
+        node = 0
+        for char in pattern:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][char] = child
+            node = child
+        self._out[node].append(index)
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _on_boundary(self, text: str, index: int, start: int, end: int) -> bool:
+        pattern = self._patterns[index]
+        if _is_word_char(pattern[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(pattern[-1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def match(self, text: str) -> Set[int]:
+        """
+        返回命中的 topic 在 self.topics 中的下标
+        """
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for pos, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                if index not in found and self._on_boundary(text, index, pos + 1 - len(self._patterns[index]), pos + 1):
+                    found.add(index)
+        return found
+
+    def match_topics(self, text: str) -> List[str]:
+        return [self.topics[index] for index in sorted(self.match(text))]
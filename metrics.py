@@ -0,0 +1,143 @@
+"""
+运行时打点: 各阶段耗时直方图、请求字节数、重试次数、LLM token 速率等
+默认关闭, 打开后 (main.py --profile) 在进程结束时输出一份 json 报告或 Prometheus textfile
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+# 耗时直方图的分桶(秒), 其他直方图按 observe 时给的 buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def render(key: Key) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def quantile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._counters: Dict[Key, float] = {}
+        self._samples: Dict[Key, List[float]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SECONDS_BUCKETS, **labels) -> None:
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._buckets.setdefault(name, buckets)
+            self._samples.setdefault(key, []).append(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """
+        统计一段代码的耗时, 记到 news_stage_seconds{stage=...}
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("news_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def report(self) -> dict:
+        with self._lock:
+            counters = {render(key): value for key, value in sorted(self._counters.items())}
+            histograms = {}
+            for key, samples in sorted(self._samples.items()):
+                ordered = sorted(samples)
+                histograms[render(key)] = {
+                    "count": len(ordered),
+                    "sum": sum(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "p50": quantile(ordered, 0.5),
+                    "p90": quantile(ordered, 0.9),
+                    "p99": quantile(ordered, 0.99),
+                    "max": ordered[-1],
+                }
+        return {
+            "started_at": self.started_at.isoformat(),
+            "elapsed_seconds": time.perf_counter() - self._start,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{render(key)} {number(value)}" for key, value in sorted(self._counters.items())
+                             if key[0] == name)
+            for name in sorted({name for name, _ in self._samples}):
+                lines.append(f"# TYPE {name} histogram")
+                for key, samples in sorted(self._samples.items()):
+                    if key[0] != name:
+                        continue
+                    labels = key[1]
+                    for bound in self._buckets[name] + (float("inf"),):
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        count = sum(1 for value in samples if value <= bound)
+                        lines.append(f"{render((name + '_bucket', labels + (('le', le),)))} {count}")
+                    lines.append(f"{render((name + '_sum', labels))} {number(sum(samples))}")
+                    lines.append(f"{render((name + '_count', labels))} {len(samples)}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str = "-") -> None:
+        """
+        path 以 .prom 结尾写 Prometheus textfile, 否则写 json; "-" 输出到 stderr
+        先写临时文件再改名, node_exporter 不会读到写了一半的文件
+        """
+        text = self.prometheus() if path.endswith(".prom") else json.dumps(self.report(), indent=2) + "\n"
+        if path == "-":
+            sys.stderr.write(text)
+            return
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+
+metrics = Metrics()
@@ -1,13 +1,63 @@
-from langchain_community.llms import Ollama
-from langchain_openai import OpenAI
-from langchain.schema.runnable import RunnableSequence
-from langchain.prompts import PromptTemplate
-from tools import logger
+"""
+langchain 相关的 import 和模型都延迟到第一次需要 LLM 时, 只看 brief 的命令不用付这部分启动开销
+"""
+from __future__ import annotations
+
+import os
+import re
+import hashlib
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+from tools import count_tokens, logger, split_chunks
+from clean import clean_content
+from cache import DiskCache
+from metrics import RATE_BUCKETS, metrics
+
+if TYPE_CHECKING:
+    from langchain.schema.runnable import RunnableSequence
+    from langchain.prompts import PromptTemplate
+
+# 按 (model_type, model_id, prompt 模板, 输入) 的 hash 缓存生成结果
+llm_cache = DiskCache("llm", ttl=None, max_entries=int(os.environ.get("NEWS_LLM_CACHE_SIZE", 20000)))
+# 整个进程同时进行的生成数上限, 单篇、批量和长文章分块的生成共用, 超出的排队
+# 调用方 (summarize_iter 的 llm_workers, server 的 llm_concurrency) 的限制管的是同时处理几篇, 这里管实际打到模型的请求
+# 默认取 NEWS_LLM_CONCURRENCY, 用 configure_llm(concurrency=...) 或 main.py --llm-concurrency 修改
+llm_slots = threading.BoundedSemaphore(int(os.environ.get("NEWS_LLM_CONCURRENCY", 2)))
+
+
+@contextmanager
+def llm_slot():
+    start = time.perf_counter()
+    with llm_slots:
+        metrics.observe("news_stage_seconds", time.perf_counter() - start, stage="llm_queue")
+        yield
+
+
+class SummaryResult(BaseModel):
+    summary: str
+    translation: str
+
+
+class SummaryStream:
+    """
+    stream_summary 的返回值: 迭代得到边生成边显示的文本, 迭代完后 result 是摘要和翻译
+    """
+
+    def __init__(self, chunks: Generator[str, None, SummaryResult]) -> None:
+        self._chunks = chunks
+        self.result: Optional[SummaryResult] = None
+
+    def __iter__(self) -> Iterator[str]:
+        self.result = yield from self._chunks
 
 
 class LLM:
 
-    summary_prompt_template = PromptTemplate(template=
+    summary_prompt = (
     """
     I want you to act as a News Article summarizer. 
     I will provide you with a article on a specific topic: 
@@ -18,32 +68,408 @@ class LLM:
     Your summary should be written in your own words and should not include any direct quotes from the paper. Please ensure that your summary is clear, concise,
       and accurately reflects the content of the original paper.
       finally, I need u translating it to chinese.
-    """, input_variables=["article"])
-    translate_prompt_template = PromptTemplate(template=
+    """)
+    translate_prompt = (
         """
         You are an expert in Chinese-English translation and you need to translate the English content:
         {content}
         I give you into meaningful Chinese. 
-        """, input_variables=["content"]
+        """
     )
+    # 一次生成同时输出英文摘要和中文翻译, 省掉第二次 translate 调用
+    fused_prompt = (
+    """
+    I want you to act as a News Article summarizer. 
+    I will provide you with a article on a specific topic: 
+    {article}
+    and you will create a concise, objective summary of the main points and findings of the article, 
+    written in your own words without direct quotes or personal opinions. 
+    Then translate your summary into meaningful Chinese. 
+    Reply in exactly this format and nothing else:
+    SUMMARY:
+    <the English summary>
+    TRANSLATION:
+    <the Chinese translation>
+    """)
+    # 长文章 map-reduce: 先分块各自总结 (map), 再把分块摘要合成一篇 (reduce)
+    map_prompt = (
+    """
+    The following is one part of a longer news article:
+    {chunk}
+    Summarize the key facts, figures and findings of this part in a few concise sentences. 
+    Do not add any personal opinions or information that is not in the text.
+    """)
+    reduce_prompt = (
+    """
+    I want you to act as a News Article summarizer. 
+    The following are summaries of consecutive parts of one news article: 
+    {summaries}
+    Combine them into one concise, objective summary of the main points and findings of the whole article, 
+    written in your own words without direct quotes or personal opinions.
+    """)
+    # 超过 chunk_tokens 的文章走 map-reduce, 分块的 map 一次最多提交 chunk_concurrency 个, 同时生成的总数受 llm_slots 限制
+    chunk_tokens = int(os.environ.get("NEWS_LLM_CHUNK_TOKENS", 1500))
+    chunk_concurrency = int(os.environ.get("NEWS_LLM_CHUNK_CONCURRENCY", 4))
+    # 生成摘要前先清洗正文 (clean.py), NEWS_LLM_CLEAN=0 关闭
+    clean = os.environ.get("NEWS_LLM_CLEAN", "1") != "0"
+    fused_output_pattern = re.compile(r"SUMMARY:\s*(?P<summary>.*?)\s*TRANSLATION:\s*(?P<translation>.*)", re.S | re.I)
+    fused_markers = [re.compile(r"SUMMARY:", re.I), re.compile(r"TRANSLATION:", re.I)]
 
-    def __init__(self, model_type: str, model_id: str) -> None:
+    def __init__(self, model_type: str, model_id: str, base_url: str = None) -> None:
+        from langchain.prompts import PromptTemplate
+
+        # base_url 为空时用各自的默认地址
+        kwargs = {"base_url": base_url} if base_url else {}
         if model_type == "Ollama":
-            llm = Ollama(model=model_id)
+            from langchain_community.llms import Ollama
+            llm = Ollama(model=model_id, **kwargs)
         elif model_type == "OpenAI":
-            llm = OpenAI(model_name=model_id)
+            from langchain_openai import OpenAI
+            llm = OpenAI(model_name=model_id, **kwargs)
         else:
             raise ValueError("Unsupported model type")
+        self.summary_prompt_template = PromptTemplate(template=self.summary_prompt, input_variables=["article"])
+        self.translate_prompt_template = PromptTemplate(template=self.translate_prompt, input_variables=["content"])
+        self.fused_prompt_template = PromptTemplate(template=self.fused_prompt, input_variables=["article"])
+        self.map_prompt_template = PromptTemplate(template=self.map_prompt, input_variables=["chunk"])
+        self.reduce_prompt_template = PromptTemplate(template=self.reduce_prompt, input_variables=["summaries"])
+        self.model_type = model_type
+        self.model_id = model_id
         self.summary_chain = self.summary_prompt_template | llm
         self.translate_chain = self.translate_prompt_template | llm
+        self.fused_chain = self.fused_prompt_template | llm
+        self.map_chain = self.map_prompt_template | llm
+        self.reduce_chain = self.reduce_prompt_template | llm
+        # 打点时用来区分是哪一步生成
+        self.chain_names = {id(self.summary_chain): "summary", id(self.translate_chain): "translate",
+                            id(self.fused_chain): "fused", id(self.map_chain): "map",
+                            id(self.reduce_chain): "reduce"}
+
+    def cache_key(self, prompt: PromptTemplate, text: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.model_type, self.model_id, prompt.template, text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _record(self, chain: RunnableSequence, texts: List[str], outputs: List[str], elapsed: float) -> None:
+        """
+        记录一次 (或一批) 生成的耗时、输入输出 token 数和输出 token 速率
+        """
+        if not metrics.enabled:
+            return
+        name = self.chain_names[id(chain)]
+        output_tokens = sum(count_tokens(output) for output in outputs)
+        metrics.observe("news_stage_seconds", elapsed, stage="llm", chain=name)
+        metrics.inc("news_llm_calls_total", len(outputs), chain=name)
+        metrics.inc("news_llm_tokens_total", sum(count_tokens(text) for text in texts), chain=name, kind="input")
+        metrics.inc("news_llm_tokens_total", output_tokens, chain=name, kind="output")
+        if elapsed > 0:
+            metrics.observe("news_llm_tokens_per_second", output_tokens / elapsed, buckets=RATE_BUCKETS, chain=name)
+
+    def _invoke(self, chain: RunnableSequence, prompt: PromptTemplate, text: str, use_cache: bool) -> str:
+        """
+        use_cache=False 时跳过读缓存, 但仍会用新结果刷新缓存
+        """
+        key = self.cache_key(prompt, text)
+        if use_cache:
+            result = llm_cache.get(key)
+            if result is not None:
+                return result
+        with llm_slot():
+            start = time.perf_counter()
+            result = chain.invoke({prompt.input_variables[0]: text})
+            self._record(chain, [text], [result], time.perf_counter() - start)
+        llm_cache.set(key, result)
+        return result
+
+    def _stream(self, chain: RunnableSequence, prompt: PromptTemplate, text: str, use_cache: bool) -> Iterator[str]:
+        """
+        命中缓存时一次性返回整段, 否则边生成边返回, 完整生成后才写缓存
+        """
+        key = self.cache_key(prompt, text)
+        if use_cache:
+            result = llm_cache.get(key)
+            if result is not None:
+                yield result
+                return
+        chunks = []
+        # 调用方不再迭代时, generator 关闭会释放名额
+        with llm_slot():
+            start = time.perf_counter()
+            for chunk in chain.stream({prompt.input_variables[0]: text}):
+                if not chunks:
+                    metrics.observe("news_stage_seconds", time.perf_counter() - start, stage="llm_first_token",
+                                    chain=self.chain_names[id(chain)])
+                chunks.append(chunk)
+                yield chunk
+            self._record(chain, [text], ["".join(chunks)], time.perf_counter() - start)
+        llm_cache.set(key, "".join(chunks))
+
+    def _invoke_batch(self, chain: RunnableSequence, prompt: PromptTemplate, texts: List[str],
+                      use_cache: bool, max_concurrency: int) -> List[Optional[str]]:
+        """
+        只把缓存未命中的并发生成, 单条失败记日志并返回 None, 不影响其他条目
+        max_concurrency 是这一批最多同时排队的条数, 实际同时生成的还受 llm_slots 限制
+        """
+        results: List[Optional[str]] = [None] * len(texts)
+        keys = [self.cache_key(prompt, text) for text in texts]
+        pending = []
+        for i, key in enumerate(keys):
+            if use_cache:
+                results[i] = llm_cache.get(key)
+            if results[i] is None:
+                pending.append(i)
+        if pending:
+            variable = prompt.input_variables[0]
+            start = time.perf_counter()
+            # 不用 chain.batch: langchain 的 BaseLLM.batch 对 Ollama 是逐条顺序 generate, 并没有并发
+            with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+                futures = [pool.submit(self._generate, chain, {variable: texts[i]}) for i in pending]
+                wait(futures)
+            outputs = [future.exception() or future.result() for future in futures]
+            # 一批并发生成, 记的是整批的耗时和总 token 速率
+            self._record(chain, [texts[i] for i in pending],
+                         [output for output in outputs if not isinstance(output, Exception)],
+                         time.perf_counter() - start)
+            for i, output in zip(pending, outputs):
+                if isinstance(output, Exception):
+                    logger.error("Error: Unable to generate for batch item {}, detail: {}".format(i, output))
+                    continue
+                llm_cache.set(keys[i], output)
+                results[i] = output
+        return results
 
-    def generate_summary(self, content: str) -> str:
+    @staticmethod
+    def _generate(chain: RunnableSequence, inputs: dict) -> str:
+        with llm_slot():
+            return chain.invoke(inputs)
+
+    def map_chunks(self, content: str, use_cache: bool = True) -> Optional[str]:
+        """
+        长文章的 map 阶段: 切块后并发总结, 返回拼起来的分块摘要; 不需要分块时返回 None
+        拼起来仍然超过 chunk_tokens 时, 把分块摘要再分块总结一轮, 直到放得进一个 prompt
+        第一轮所有块都失败时也返回 None, 退回整篇一次生成
+        每块按自己的内容缓存, 文章只改了一部分时其他块直接命中
+        """
+        if count_tokens(content) <= self.chunk_tokens:
+            return None
+        chunks = split_chunks(content, self.chunk_tokens)
+        combined = None
+        while True:
+            logger.info(f"Summarizing {len(chunks)} chunks...")
+            summaries = self._invoke_batch(self.map_chain, self.map_prompt_template, chunks,
+                                           use_cache, self.chunk_concurrency)
+            failed = sum(1 for summary in summaries if summary is None)
+            summaries = [summary.strip() for summary in summaries if summary is not None]
+            if not summaries:
+                logger.error(f"Error: all {len(chunks)} chunks failed to summarize")
+                return combined
+            if failed:
+                # 部分块失败时用剩下的块继续, 摘要会缺这部分内容
+                logger.warning(f"{failed} of {len(chunks)} chunks failed to summarize, "
+                               "the summary only covers the rest of the article")
+                metrics.inc("news_llm_chunk_failures_total", failed)
+            combined = "\n\n".join(summaries)
+            next_chunks = split_chunks(combined, self.chunk_tokens)
+            # 已经放得下, 或者再总结也缩不小了
+            if len(next_chunks) <= 1 or len(next_chunks) >= len(chunks):
+                return combined
+            chunks = next_chunks
+
+    def prepare(self, content: str) -> str:
+        """
+        清洗正文, 记录清洗前后的输入 token 数; 清完什么都不剩时原样返回
+        """
+        if not self.clean:
+            return content
+        cleaned = clean_content(content)
+        before, after = count_tokens(content), count_tokens(cleaned)
+        logger.info(f"Cleaned content: {before} -> {after} tokens")
+        metrics.inc("news_llm_content_tokens_total", before, kind="raw")
+        metrics.inc("news_llm_content_tokens_total", after, kind="clean")
+        return cleaned or content
+
+    def _summary_input(self, content: str, use_cache: bool) -> Tuple[RunnableSequence, PromptTemplate, str]:
+        """
+        短文章直接用 summary prompt, 长文章先 map, 再用 reduce prompt 合成
+        """
+        combined = self.map_chunks(content, use_cache)
+        if combined is None:
+            return self.summary_chain, self.summary_prompt_template, content
+        return self.reduce_chain, self.reduce_prompt_template, combined
+
+    @classmethod
+    def parse_fused_output(cls, output: str) -> SummaryResult:
+        match = cls.fused_output_pattern.search(output)
+        if match:
+            return SummaryResult(summary=match.group("summary"), translation=match.group("translation").strip())
+        # 模型没按格式输出时, 整段当作结果
+        logger.warning("Fused output is not in the expected format")
+        return SummaryResult(summary=output.strip(), translation=output.strip())
+
+    @classmethod
+    def hide_fused_markers(cls, chunks: Iterable[str]) -> Generator[str, None, str]:
+        """
+        流式显示 fused 输出时去掉 SUMMARY: / TRANSLATION: 标记, 摘要和翻译之间空一行, 返回完整的原始输出
+        标记可能被切在两个 chunk 之间, 缓冲区末尾可能是下一个标记开头的部分先不输出
+        """
+        raw, buffer, markers, strip = [], "", list(cls.fused_markers), False
+        for chunk in chunks:
+            raw.append(chunk)
+            buffer += chunk
+            while markers:
+                match = markers[0].search(buffer)
+                if not match:
+                    break
+                head = buffer[:match.start()].rstrip()
+                if head:
+                    yield head
+                if markers.pop(0) is cls.fused_markers[-1]:
+                    yield "\n\n"
+                buffer = buffer[match.end():].lstrip()
+                strip = not buffer
+            if strip:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    continue
+                strip = False
+            end = len(buffer) - (len(markers[0].pattern) - 1 if markers else 0)
+            # 末尾的空白留到后面还有内容时再输出, 标记前和结尾的空白都不显示
+            while end > 0 and buffer[end - 1].isspace():
+                end -= 1
+            if end > 0:
+                yield buffer[:end]
+                buffer = buffer[end:]
+        if buffer.strip():
+            yield buffer.rstrip()
+        return "".join(raw)
+
+    def generate_fused_summary(self, content: str, use_cache: bool = True) -> SummaryResult:
+        """
+        长文章的 reduce 和翻译一起做: 分块摘要拼起来作为 fused prompt 的输入
+        """
+        content = self.prepare(content)
+        content = self.map_chunks(content, use_cache) or content
+        logger.info("Generating summary and translation...")
+        output = self._invoke(self.fused_chain, self.fused_prompt_template, content, use_cache)
+        return self.parse_fused_output(output)
+
+    def generate_summary(self, content: str, use_cache: bool = True, fused: bool = False) -> str:
+        if fused:
+            return self.generate_fused_summary(content, use_cache).translation
+        chain, prompt, text = self._summary_input(self.prepare(content), use_cache)
         logger.info("Generating summary...")
-        summary_content = self.summary_chain.run(content)
+        summary_content = self._invoke(chain, prompt, text, use_cache)
         logger.info("Summary generated. and translate...")
-        return self.translate(summary_content)
+        return self.translate(summary_content, use_cache=use_cache)
     
-    def translate(self, content: str) -> str:
-        return self.translate_chain.run(content)
+    def stream_summary(self, content: str, use_cache: bool = True, fused: bool = False) -> SummaryStream:
+        """
+        流式输出: 先输出英文摘要, 空一行再输出中文翻译, 迭代完后 result 是摘要和翻译, 和非流式的结果一致
+        长文章的 map 阶段不流式, 从 reduce 开始流式输出
+        """
+        return SummaryStream(self._stream_summary(content, use_cache, fused))
+
+    def _stream_summary(self, content: str, use_cache: bool, fused: bool) -> Generator[str, None, SummaryResult]:
+        content = self.prepare(content)
+        if fused:
+            content = self.map_chunks(content, use_cache) or content
+            output = yield from self.hide_fused_markers(
+                self._stream(self.fused_chain, self.fused_prompt_template, content, use_cache))
+            return self.parse_fused_output(output)
+        chain, prompt, text = self._summary_input(content, use_cache)
+        summary, translation = [], []
+        for chunk in self._stream(chain, prompt, text, use_cache):
+            summary.append(chunk)
+            yield chunk
+        yield "\n\n"
+        for chunk in self._stream(self.translate_chain, self.translate_prompt_template, "".join(summary), use_cache):
+            translation.append(chunk)
+            yield chunk
+        return SummaryResult(summary="".join(summary).strip(), translation="".join(translation).strip())
+
+    def translate(self, content: str, use_cache: bool = True) -> str:
+        return self._invoke(self.translate_chain, self.translate_prompt_template, content, use_cache)
+
+    def generate_summary_batch(self, contents: List[str], max_concurrency: int = 4,
+                               use_cache: bool = True, fused: bool = False) -> List[Optional[str]]:
+        """
+        批量生成摘要并翻译, 返回与 contents 同序的列表, 失败的条目为 None
+        max_concurrency 是这一批同时提交的条数, 实际同时生成的不超过进程的 llm_slots 上限 (configure_llm 的 concurrency)
+        """
+        contents = [self.prepare(content) for content in contents]
+        # 长文章先各自 map, 得到的分块摘要再和短文章一起批量生成
+        combined = [self.map_chunks(content, use_cache) for content in contents]
+        if fused:
+            logger.info(f"Generating {len(contents)} summaries and translations...")
+            outputs = self._invoke_batch(self.fused_chain, self.fused_prompt_template,
+                                         [text or content for text, content in zip(combined, contents)],
+                                         use_cache, max_concurrency)
+            return [None if output is None else self.parse_fused_output(output).translation for output in outputs]
+        logger.info(f"Generating {len(contents)} summaries...")
+        summaries: List[Optional[str]] = [None] * len(contents)
+        for chain, prompt, indices in (
+            (self.summary_chain, self.summary_prompt_template, [i for i, text in enumerate(combined) if text is None]),
+            (self.reduce_chain, self.reduce_prompt_template, [i for i, text in enumerate(combined) if text is not None]),
+        ):
+            if not indices:
+                continue
+            texts = [combined[i] or contents[i] for i in indices]
+            for i, summary in zip(indices, self._invoke_batch(chain, prompt, texts, use_cache, max_concurrency)):
+                summaries[i] = summary
+        done = [i for i, summary in enumerate(summaries) if summary is not None]
+        logger.info(f"{len(done)} summaries generated. and translate...")
+        translations = self.translate_batch([summaries[i] for i in done], max_concurrency, use_cache)
+        results: List[Optional[str]] = [None] * len(contents)
+        for i, translation in zip(done, translations):
+            results[i] = translation
+        return results
+
+    def translate_batch(self, contents: List[str], max_concurrency: int = 4,
+                        use_cache: bool = True) -> List[Optional[str]]:
+        """
+        max_concurrency 同 generate_summary_batch, 受 llm_slots 上限限制
+        """
+        return self._invoke_batch(self.translate_chain, self.translate_prompt_template, contents,
+                                  use_cache, max_concurrency)
     
-llm = LLM(model_type="Ollama", model_id="qwen-chat-14B-Q4_0:latest")
+default_model = {
+    "model_type": os.environ.get("NEWS_MODEL_TYPE", "Ollama"),
+    "model_id": os.environ.get("NEWS_MODEL_ID", "qwen-chat-14B-Q4_0:latest"),
+    "base_url": os.environ.get("NEWS_MODEL_BASE_URL", ""),
+}
+_llms: Dict[Tuple[str, str], LLM] = {}
+_llms_lock = threading.Lock()
+
+
+def configure_llm(model_type: str = None, model_id: str = None, base_url: str = None,
+                  concurrency: int = None) -> None:
+    """
+    修改 get_llm() 默认使用的模型; concurrency 是整个进程同时进行的生成数上限
+    修改上限时已经拿到名额的生成不受影响, 之后的按新上限排队
+    """
+    global llm_slots
+    if concurrency:
+        llm_slots = threading.BoundedSemaphore(concurrency)
+    if model_type:
+        default_model["model_type"] = model_type
+    if model_id:
+        default_model["model_id"] = model_id
+    if base_url:
+        default_model["base_url"] = base_url
+
+
+def get_llm(model_type: str = None, model_id: str = None) -> LLM:
+    key = (model_type or default_model["model_type"], model_id or default_model["model_id"])
+    with _llms_lock:
+        if key not in _llms:
+            _llms[key] = LLM(model_type=key[0], model_id=key[1], base_url=default_model["base_url"])
+        return _llms[key]
+
+
+def __getattr__(name):
+    # 兼容旧的 from models import llm
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
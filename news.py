@@ -38,16 +38,6 @@ def text_output(text: str, max_line_num=100):
         total_len -= max_line_num
 
 
-def translate_text(text):
-    data = [text, "en", "zh"]
-    url = "https://hf.space/embed/mikeee/gradio-deepl/+/api/predict"
-    resp = requests.post(url, json={"data": data})
-    if resp.status_code == 200:
-        print(resp.json())
-        return resp.json()["data"][0]
-    return text
-
-
 def retry_on_error(retry_times=3):
     """
     被装饰的函数必须同时返回结果、和状态码
@@ -204,18 +194,23 @@ class Bloomberg(News):
 
     def get_brief(self, topic: str, translate: bool):
         articles = self.get_articles(topic)
-        for article in articles:
+        translations = []
+        if translate and articles:
+            from NLLB import get_translator
+            translations = get_translator().translate_batch(
+                [article.title for article in articles] + [article.description for article in articles])
+        for i, article in enumerate(articles):
             print("-" * 30)
             print(f"title: {article.title}")
-            if translate:
-                print(f"translated title: {translate_text(article.title)}")
+            if translations:
+                print(f"translated title: {translations[i]}")
             print(f"url: {article.url}")
             print(f"brief: ")
             brief = article.description
             text_output(brief)
-            if translate:
+            if translations:
                 print(f"translated brief: ")
-                text_output(translate_text(brief))
+                text_output(translations[len(articles) + i])
             print("-" * 30)
 
 
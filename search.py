@@ -0,0 +1,114 @@
+"""
+sqlite FTS5 全文索引, 覆盖标题、简介和正文
+查询直接用 FTS5 语法: 短语 "rate cut", 布尔 oil NOT opec, 前缀 infla*, 限定列 title:fed
+"""
+import os
+import sqlite3
+import threading
+from typing import Iterable, List
+from cache import CACHE_DIR
+from tools import logger
+
+SEARCH_DB = os.environ.get("NEWS_SEARCH_DB", os.path.join(CACHE_DIR, "search.db"))
+
+_schema = """
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    body TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_documents_url ON documents (url);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, description, body, content='documents', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, description, body) VALUES (new.rowid, new.title, new.description, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, description, body)
+        VALUES ('delete', old.rowid, old.title, old.description, old.body);
+    INSERT INTO documents_fts (rowid, title, description, body) VALUES (new.rowid, new.title, new.description, new.body);
+END;
+"""
+
+
+class SearchIndex:
+
+    def __init__(self, path: str = SEARCH_DB) -> None:
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_schema)
+            self._conn = conn
+        return self._conn
+
+    def add_articles(self, source: str, items: Iterable[dict]) -> int:
+        """
+        加入 feed 原始条目, 已经索引过的 id 跳过, 返回新增条数
+        """
+        rows = [(item["id"], source, item["url"], item["publishedAt"], item["title"], item["description"])
+                for item in items]
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO documents (id, source, url, published_at, title, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+            return cursor.rowcount
+
+    def add_body(self, url: str, body: str) -> bool:
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute("UPDATE documents SET body = ? WHERE url = ? AND body != ?", (body, url, body))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def search(self, query: str, limit: int = 20, source: str = None) -> List[dict]:
+        """
+        按 bm25 排序, 标题命中权重最高, 正文最低
+        """
+        sql = (
+            "SELECT d.id, d.source, d.url, d.published_at, d.title, "
+            "snippet(documents_fts, -1, '[', ']', '...', 12) AS snippet, "
+            "bm25(documents_fts, 10.0, 5.0, 1.0) AS score "
+            "FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid "
+            "WHERE documents_fts MATCH ?"
+        )
+        params = [query]
+        if source:
+            sql += " AND d.source = ?"
+            params.append(source)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def reindex(self, archive) -> int:
+        """
+        从本地归档重建: 先导入所有条目, 再补正文
+        """
+        added = 0
+        sources = sorted(os.listdir(archive.root)) if os.path.isdir(archive.root) else []
+        for source in sources:
+            added += self.add_articles(source, archive.scan(source=source))
+            for record in archive.bodies(source=source):
+                self.add_body(record["url"], record["body"])
+        logger.info(f"Indexed {added} articles from {archive.root}")
+        return added
+
+
+search_index = SearchIndex()
+# NEWS_SEARCH=0 关闭增量索引
+search_enabled = os.environ.get("NEWS_SEARCH", "1") != "0"
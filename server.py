@@ -0,0 +1,204 @@
+"""
+常驻的 HTTP/JSON 服务, 省掉每次起进程、拉 feed 和重复调用 LLM 的开销:
+    GET /brief?source=reuters&topic=oil                   文章列表
+    GET /content?source=reuters&url=...                    文章正文
+    GET /summary?source=reuters&url=...&fused=1            单篇摘要
+    GET /summary?source=reuters&topic=oil&top_k=3          topic 下前 top_k 篇的摘要
+    GET /health
+feed 在进程内缓存 feed_max_age 秒; 同一个 feed / 正文 / 摘要的并发请求合并成一次 (single-flight)
+上游请求和 LLM 生成各用一个信号量限制并发, 排队超过 queue_timeout 秒返回 503; 拉不到 feed 或正文返回 502
+python main.py --serve --port 8000
+"""
+import json
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, List
+from urllib.parse import parse_qs, urlsplit
+from models import get_llm
+from tools import logger
+from sources import News, NewsArticle, source_classes
+
+
+class Busy(Exception):
+    pass
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class SingleFlight:
+    """
+    同一个 key 同时只执行一次, 执行期间到达的调用等待并共享结果 (或异常)
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class NewsService:
+    """
+    brief / content / summary 的处理逻辑, 和 HTTP 无关
+    """
+
+    def __init__(self, feed_max_age: float = 60, upstream_concurrency: int = 8, llm_concurrency: int = 2,
+                 queue_timeout: float = 30, coalesce: bool = True) -> None:
+        self.feed_max_age = feed_max_age
+        self.queue_timeout = queue_timeout
+        self.coalesce = coalesce
+        self._clients: Dict[str, News] = {name: cls() for name, cls in source_classes.items()}
+        self._upstream = threading.BoundedSemaphore(upstream_concurrency)
+        self._llm = threading.BoundedSemaphore(llm_concurrency)
+        self._flight = SingleFlight()
+        self._pool = ThreadPoolExecutor(max_workers=upstream_concurrency + llm_concurrency)
+
+    def client(self, source: str) -> News:
+        if source not in self._clients:
+            raise ValueError(f"unknown source {source!r}, choose from {', '.join(self._clients)}")
+        return self._clients[source]
+
+    def _call(self, key: Hashable, func: Callable, *args):
+        if self.coalesce:
+            return self._flight.do(key, func, *args)
+        return func(*args)
+
+    def _limited(self, semaphore: threading.BoundedSemaphore, func: Callable, *args):
+        if not semaphore.acquire(timeout=self.queue_timeout):
+            raise Busy("too many requests in flight")
+        try:
+            return func(*args)
+        finally:
+            semaphore.release()
+
+    def brief(self, source: str, topic: str = "") -> List[NewsArticle]:
+        client = self.client(source)
+        # 合并的只是 feed 下载, topic 过滤各自做
+        feed = self._call(("feed", source), self._limited, self._upstream, client.get_feed, self.feed_max_age)
+        if feed is None:
+            raise UpstreamError(f"unable to fetch the {source} feed")
+        return client.filter_articles(feed, topic)
+
+    def content(self, source: str, url: str) -> str:
+        client = self.client(source)
+        return self._call(("content", source, url), self._limited, self._upstream, client.get_article_content, url)
+
+    def summary(self, source: str, url: str, fused: bool = False) -> str:
+        return self._call(("summary", source, url, fused), self._summary, source, url, fused)
+
+    def _summary(self, source: str, url: str, fused: bool) -> str:
+        content = self.content(source, url)
+        if not content:
+            return ""
+        return self._limited(self._llm, functools.partial(get_llm().generate_summary, content, fused=fused))
+
+    def summaries(self, source: str, topic: str, top_k: int = 3, fused: bool = False) -> List[dict]:
+        articles = self.brief(source, topic)[:top_k]
+        futures = [self._pool.submit(self.summary, source, article.url, fused) for article in articles]
+        return [{"article": article.model_dump(mode="json"), "summary": future.result()}
+                for article, future in zip(articles, futures)]
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认 listen backlog 只有 5, 并发连接一多就会丢 SYN, 客户端要等 1s 重传
+    request_queue_size = 128
+
+
+def make_handler(service: NewsService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug("{} {}", self.address_string(), format % args)
+
+        def reply(self, status: int, data, headers: Dict[str, str] = None):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+            source = query.get("source", "bloomberg")
+            fused = query.get("fused", "") in ("1", "true")
+            try:
+                if parts.path == "/health":
+                    return self.reply(200, {"status": "ok"})
+                if parts.path == "/brief":
+                    articles = service.brief(source, query.get("topic", ""))
+                    return self.reply(200, [article.model_dump(mode="json") for article in articles])
+                if parts.path == "/content":
+                    if not query.get("url"):
+                        return self.reply(400, {"error": "url is required"})
+                    content = service.content(source, query["url"])
+                    if not content:
+                        return self.reply(502, {"error": f"unable to fetch {query['url']}"})
+                    return self.reply(200, {"url": query["url"], "content": content})
+                if parts.path == "/summary":
+                    if query.get("url"):
+                        summary = service.summary(source, query["url"], fused)
+                        if not summary:
+                            return self.reply(502, {"error": f"unable to fetch {query['url']}"})
+                        return self.reply(200, {"url": query["url"], "summary": summary})
+                    top_k = int(query.get("top_k", 3))
+                    return self.reply(200, service.summaries(source, query.get("topic", ""), top_k, fused))
+                return self.reply(404, {"error": f"no route {parts.path}"})
+            except ValueError as e:
+                return self.reply(400, {"error": str(e)})
+            except Busy as e:
+                return self.reply(503, {"error": str(e)}, {"Retry-After": "1"})
+            except UpstreamError as e:
+                return self.reply(502, {"error": str(e)})
+            except Exception as e:
+                logger.exception("Error: Unable to serve {}".format(self.path))
+                return self.reply(500, {"error": str(e)})
+
+    return Handler
+
+
+def make_server(service: NewsService, host: str = "127.0.0.1", port: int = 8000) -> ApiServer:
+    return ApiServer((host, port), make_handler(service))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, **kwargs) -> None:
+    httpd = make_server(NewsService(**kwargs), host, port)
+    logger.info(f"Serving on http://{host}:{httpd.server_address[1]}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
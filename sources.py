@@ -1,19 +1,36 @@
+import os
 import re
+import gc
+import json
+import time
+import sqlite3
 import requests
-from typing import List, Tuple
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from datetime import datetime
-from pydantic import BaseModel
-from common import OK, ERR
-from bs4 import BeautifulSoup
-from models import llm
-from tools import retry_on_error, logger, text_output
+from pydantic import BaseModel, TypeAdapter
+from common import OK
+from bs4 import BeautifulSoup, SoupStrainer
+from cache import content_cache, normalize_url
+from matcher import TopicMatcher
+from index import symbol_index
+from dedup import DuplicateIndex
+from archive import archive, archive_enabled
+from search import search_index, search_enabled
+from models import get_llm
+from metrics import metrics
+from tools import error_status, http_get, retry_on_error, logger, stream_output, text_output, translate_texts
 
 sources = []
+source_classes = {}
 
 
 def register_sources(cls):
     if cls.source not in sources:
         sources.append(cls.source)
+    source_classes[cls.source] = cls
     return cls
 
 
@@ -39,117 +56,537 @@ class NewsArticle(BaseModel):
         return cls(source=new_source, **kwargs)
     
 
+def print_article(article: NewsArticle, translated_title: str = "", translated_brief: str = ""):
+    print(f"title: {article.title}")
+    if translated_title:
+        print(f"translated title: {translated_title}")
+    print(f"url: {article.url}")
+    print(f"brief: ")
+    text_output(article.description)
+    if translated_brief:
+        print(f"translated brief: ")
+        text_output(translated_brief)
+    print("-"*30)
+
+
+class ArticleRecord(BaseModel):
+    """
+    流水线输出的一篇文章, --format ndjson 时每条一行
+    summary 是中文摘要; 近似重复的文章 same_story_as 是代表文章的 url, 代表文章的 related 是归到它的重复文章 url
+    """
+    article: NewsArticle
+    translated_title: str = ""
+    translated_brief: str = ""
+    summary: Optional[str] = None
+    same_story_as: Optional[str] = None
+    related: List[str] = []
+    error: Optional[str] = None
+
+
+def brief_records(articles: Iterable[NewsArticle], translate: bool = False,
+                  batch_size: int = 16) -> Iterator[ArticleRecord]:
+    """
+    translate=True 时每 batch_size 篇的标题和简介一起批量翻译, 翻完一批就输出一批
+    """
+    articles = iter(articles)
+    if not translate:
+        for article in articles:
+            yield ArticleRecord(article=article)
+        return
+    while True:
+        batch = list(islice(articles, batch_size))
+        if not batch:
+            return
+        translations = translate_texts([article.title for article in batch] +
+                                       [article.description for article in batch])
+        for i, article in enumerate(batch):
+            yield ArticleRecord(article=article, translated_title=translations[i],
+                                translated_brief=translations[len(batch) + i])
+
+
+def print_briefs(articles: Iterable[NewsArticle], translate: bool = False) -> List[ArticleRecord]:
+    records = []
+    for record in brief_records(articles, translate):
+        print_article(record.article, record.translated_title, record.translated_brief)
+        records.append(record)
+    return records
+
+
+news_articles = TypeAdapter(List[NewsArticle])
+
+
+@contextmanager
+def gc_paused():
+    """
+    一次性创建大量对象时暂停分代 gc, 避免反复扫描刚创建的容器
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class FeedCache:
+    """
+    下载下来的 feed: 保留解码后的原始条目, 文章对象按需批量校验生成
+    """
+
+    def __init__(self, etag: str, last_modified: str, items: List[dict]) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.items = items
+        # 最近一次下载或 304 确认的时间
+        self.fetched_at = time.monotonic()
+        self._articles: Optional[List[NewsArticle]] = None
+
+    @property
+    def articles(self) -> List[NewsArticle]:
+        if self._articles is None:
+            with gc_paused():
+                self._articles = news_articles.validate_python(self.items)
+            symbol_index.add(self._articles)
+        return self._articles
+
+    def select(self, indices: List[int]) -> List[NewsArticle]:
+        """
+        只校验选中的条目, 没选中的不会生成 NewsArticle
+        """
+        if self._articles is not None:
+            return [self._articles[i] for i in indices]
+        with gc_paused():
+            articles = news_articles.validate_python([self.items[i] for i in indices])
+        symbol_index.add(articles)
+        return articles
+
+
 class News:
 
     source = ""
-    __url = "https://static.newsfilter.io/landing-page/articles-{source}.json"
+    # watch 模式下的轮询间隔(秒)
+    poll_interval = 60
+    # NEWS_FEED_URL 可以换成别的 feed 地址 (如 bench.server), 必须带 {source}
+    __url = os.environ.get("NEWS_FEED_URL", "https://static.newsfilter.io/landing-page/articles-{source}.json")
+    # 按 feed url 缓存下载过的 feed, 304 时直接复用
+    _feeds: Dict[str, FeedCache] = {}
 
     @retry_on_error()
-    def get_articles(self, topic: str = "") -> Tuple[List[NewsArticle], int]:
+    def get_feed(self, max_age: float = 0) -> Tuple[Optional[FeedCache], int]:
+        """
+        max_age 秒内拉取或确认过的 feed 直接复用, 不发请求; 默认每次都做条件请求
+        """
+        url = self.__url.format(source=self.source)
+        cached = self._feeds.get(url)
+        if cached and time.monotonic() - cached.fetched_at < max_age:
+            return cached, OK
+        headers = {}
+        if cached:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
         try:
-            response = requests.get(self.__url.format(source=self.source))
+            with metrics.timer("feed_fetch", source=self.source):
+                response = http_get(url, headers=headers)
         except requests.exceptions.RequestException as e:
             logger.error("Error: Unable to connect to NewsFilter API, detail: {}".format(e))
-            return [], ERR
+            return None, error_status(e)
         else:
-            if response.status_code == 200:
-                if topic:
-                    _topic = topic.lower()
-                    pattern = re.compile(f"\\b{_topic}\\b", re.IGNORECASE)
-                    return [NewsArticle.serialize(**article) for article in response.json() if re.search(pattern, article["description"])], OK
-                return [NewsArticle.serialize(**article) for article in response.json()], OK
+            if response.status_code == 304 and cached:
+                cached.fetched_at = time.monotonic()
+                return cached, OK
+            elif response.status_code == 200:
+                with metrics.timer("feed_decode", source=self.source), gc_paused():
+                    items = json.loads(response.content)
+                feed = FeedCache(
+                    etag=response.headers.get("ETag", ""),
+                    last_modified=response.headers.get("Last-Modified", ""),
+                    items=items,
+                )
+                self._feeds[url] = feed
+                self._on_feed(items)
+                return feed, OK
             else:
                 logger.warning("Error: Unable to fetch news from {}, detail: {}".format(self.source, response.text))
-                return [], ERR
+                return None, error_status(response)
+
+    def get_articles(self, topic: str = "", max_age: float = 0) -> List[NewsArticle]:
+        with metrics.timer("articles", source=self.source):
+            feed = self.get_feed(max_age)
+            if feed is None:
+                return []
+            return self.filter_articles(feed, topic)
+
+    @staticmethod
+    def filter_articles(feed: FeedCache, topic: str = "") -> List[NewsArticle]:
+        """
+        feed 里简介提到 topic 的文章, topic 为空时返回全部
+        """
+        if topic:
+            _topic = topic.lower()
+            pattern = re.compile(f"\\b{_topic}\\b", re.IGNORECASE)
+            return feed.select([i for i, item in enumerate(feed.items) if pattern.search(item["description"])])
+        return list(feed.articles)
+
+    def get_articles_by_topics(self, topics: Union[Iterable[str], TopicMatcher]) -> Dict[str, List[NewsArticle]]:
+        """
+        一次拉取 feed, 每篇文章的标题和简介只扫描一遍, 返回 topic -> 命中文章
+        """
+        matcher = topics if isinstance(topics, TopicMatcher) else TopicMatcher(topics)
+        result = {topic: [] for topic in matcher.topics}
+        feed = self.get_feed()
+        if feed is None:
+            return result
+        hits = [matcher.match(f"{item['title']}\n{item['description']}") for item in feed.items]
+        indices = [i for i, matched in enumerate(hits) if matched]
+        for i, article in zip(indices, feed.select(indices)):
+            for index in hits[i]:
+                result[matcher.topics[index]].append(article)
+        return result
+
+    def get_article_content(self, article_url: str, use_cache: bool = True) -> str:
+        with metrics.timer("content", source=self.source):
+            key = normalize_url(article_url)
+            if use_cache:
+                content = content_cache.get(key)
+                if content is not None:
+                    return content
+            content = self.fetch_article_content(article_url)
+            # 失败时返回的是空串, 不缓存
+            if content:
+                content_cache.set(key, content)
+                self._on_content(article_url, content)
+            return content
+
+    def _on_feed(self, items: List[dict]):
+        """
+        新下载的 feed 写入归档和全文索引, 失败只记日志
+        """
+        try:
+            if archive_enabled:
+                archive.append(self.source, items)
+            if search_enabled:
+                search_index.add_articles(self.source, items)
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            logger.warning("Error: Unable to store {} articles, detail: {}".format(self.source, e))
+
+    def _on_content(self, article_url: str, content: str):
+        try:
+            if archive_enabled:
+                archive.append_body(self.source, article_url, content)
+            if search_enabled:
+                search_index.add_body(article_url, content)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Error: Unable to store {}, detail: {}".format(article_url, e))
+
+    def fetch_article_content(self, article_url: str) -> str:
+        raise NotImplementedError
+
+    def iter_summaries(self, topic: str, top_k: int = 3, fetch_workers: int = 4, llm_workers: int = 2,
+                       fused: bool = False, dedup: bool = True, ordered: bool = True,
+                       use_cache: bool = True) -> Iterator[ArticleRecord]:
+        return summarize_iter([(self, article) for article in self.get_articles(topic)[:top_k]], fetch_workers,
+                              llm_workers, fused, dedup=dedup, ordered=ordered, use_cache=use_cache)
+
+    def get_summary(self, topic: str, top_k: int = 3, fetch_workers: int = 4, llm_workers: int = 2,
+                    fused: bool = False, stream: bool = False, dedup: bool = True,
+                    use_cache: bool = True) -> List[ArticleRecord]:
+        return self.summarize_articles(self.get_articles(topic)[:top_k], fetch_workers, llm_workers,
+                                       fused, stream, dedup, use_cache)
+
+    def summarize_articles(self, articles: List[NewsArticle], fetch_workers: int = 4, llm_workers: int = 2,
+                           fused: bool = False, stream: bool = False, dedup: bool = True,
+                           use_cache: bool = True) -> List[ArticleRecord]:
+        return summarize([(self, article) for article in articles], fetch_workers, llm_workers,
+                         fused, stream, dedup, use_cache)
 
-    def get_summary(self, topic: str, top_k: int):
-        pass
+    def iter_briefs(self, topic: str = "", translate: bool = False) -> Iterator[ArticleRecord]:
+        return brief_records(self.get_articles(topic), translate)
+
+    def get_brief(self, topic: str, translate: bool = False) -> List[ArticleRecord]:
+        return print_briefs(self.get_articles(topic), translate)
+
+
+def _summarize(content: str, fused: bool = False, use_cache: bool = True) -> str:
+    if not content:
+        return ""
+    return get_llm().generate_summary(content, use_cache=use_cache, fused=fused)
+
+
+def summarize_iter(items: Iterable[Tuple[News, NewsArticle]], fetch_workers: int = 4, llm_workers: int = 2,
+                   fused: bool = False, stream: bool = False, dedup: bool = True,
+                   ordered: bool = True, use_cache: bool = True) -> Iterator[ArticleRecord]:
+    """
+    items 是 (client, article), 可以来自不同 source, 每篇输出一条 ArticleRecord, 完成一篇就 yield 一篇
+    文章下载和 LLM 生成并行: 下载完成一篇就交给 LLM 线程池
+    fetch_workers 限制网络并发, llm_workers 限制 LLM 并发
+    ordered=True 按 items 的顺序输出, 前面的没完成时后面的先等着; False 按完成顺序输出
+    fused=True 时摘要和翻译一次生成
+    stream=True 时按顺序逐篇生成, token 边生成边打印到 stdout, 下载仍然并行
+    dedup=True 时先按标题+简介、下载后再按正文做近似去重, 同一个故事只总结一篇
+    代表下载失败、正文为空或生成失败时, 由同一故事的下一篇接替
+    use_cache=False 时不读正文和 LLM 缓存, 结果仍会写入缓存
+    """
+    items = list(items)
+    if not items:
+        return
+    duplicate_of: Dict[int, int] = {}
+    brief_index, body_index = DuplicateIndex(shingle_size=2), DuplicateIndex()
+    if dedup:
+        for i, (_, article) in enumerate(items):
+            j = brief_index.add(i, f"{article.title}\n{article.description}")
+            if j is not None:
+                duplicate_of[i] = j
+    representatives = [i for i in range(len(items)) if i not in duplicate_of]
+    # 成功出摘要的代表 / 失败后放弃的代表; 重复文章等代表出了摘要才输出
+    succeeded: Set[int] = set()
+    gave_up: Set[int] = set()
+    fetched: Set[int] = set()
+    # 按正文判成重复的文章, 代表失败时直接拿这份正文总结
+    contents: Dict[int, str] = {}
+
+    def is_duplicate(i: int, content: str) -> bool:
+        if not dedup or not content:
+            return False
+        j = body_index.add(i, content)
+        if j is None or root(j) in gave_up:
+            return False
+        duplicate_of[i] = j
+        return True
+
+    def root(i: int) -> int:
+        while i in duplicate_of:
+            i = duplicate_of[i]
+        return i
+
+    def record(i: int, **kwargs) -> ArticleRecord:
+        if i in duplicate_of:
+            kwargs["same_story_as"] = items[root(i)][1].url
+        else:
+            kwargs["related"] = [article.url for k, (_, article) in enumerate(items) if k != i and root(k) == i]
+        return ArticleRecord(article=items[i][1], **kwargs)
+
+    def give_up(i: int, error: str) -> Tuple[Optional[int], ArticleRecord]:
+        """
+        代表 i 下载或生成失败, 同一故事里最靠前的一篇接替它, 其余重复改挂到接替的文章下
+        返回接替的文章 (没有时为 None) 和 i 的记录
+        """
+        gave_up.add(i)
+        members = sorted(k for k in duplicate_of if root(k) == i)
+        successor = members[0] if members else None
+        if successor is not None:
+            del duplicate_of[successor]
+            for k in members[1:]:
+                duplicate_of[k] = successor
+            logger.info(f"Summarizing {items[successor][1].url} instead of {items[i][1].url}")
+        return successor, record(i, error=error)
+
+    def fetch(i: int) -> Future:
+        fetched.add(i)
+        return fetch_pool.submit(items[i][0].get_article_content, items[i][1].url, use_cache)
+
+    def summarize_later(content: str) -> Future:
+        return llm_pool.submit(_summarize, content, fused, use_cache)
+
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers)
+    llm_pool = ThreadPoolExecutor(max_workers=llm_workers)
+    try:
+        fetches = {i: fetch(i) for i in representatives}
+        if stream:
+            # 按顺序处理, 走到 i 时它前面的代表都已经有结果
+            for i in range(len(items)):
+                if i in duplicate_of:
+                    yield record(i)
+                    continue
+                logger.info(f"Summary for {items[i][1].title}:")
+                try:
+                    content = contents.pop(i, None) or fetches[i].result()
+                    if is_duplicate(i, content):
+                        yield record(i)
+                        continue
+                    if not content:
+                        error = "unable to fetch the article"
+                    else:
+                        stream = get_llm().stream_summary(content, use_cache, fused)
+                        stream_output(stream)
+                        # 屏幕上是英文摘要和翻译, 记录里和非流式一样只放翻译
+                        summary = stream.result.translation
+                        if summary:
+                            succeeded.add(i)
+                            yield record(i, summary=summary)
+                            continue
+                        error = "empty summary"
+                except Exception as e:
+                    logger.error("Error: Unable to summarize {}, detail: {}".format(items[i][1].url, e))
+                    error = str(e)
+                successor, failed = give_up(i, error)
+                if successor is not None:
+                    fetches[successor] = fetch(successor)
+                yield failed
+        else:
+            ready: Dict[int, ArticleRecord] = {}
+            settled: Set[int] = set()
+            pending: Dict[Future, Tuple[str, int]] = {future: ("fetch", i) for i, future in fetches.items()}
+
+            def settle(i: int, result: ArticleRecord):
+                ready[i] = result
+                settled.add(i)
+
+            def fail(i: int, error: str):
+                successor, failed = give_up(i, error)
+                settle(i, failed)
+                if successor is None:
+                    return
+                if successor in contents:
+                    pending[summarize_later(contents.pop(successor))] = ("llm", successor)
+                else:
+                    pending[fetch(successor)] = ("fetch", successor)
+
+            next_index = 0
+            while True:
+                # 代表出了摘要, 挂在它下面的重复文章就可以输出了
+                for i in list(duplicate_of):
+                    if i not in settled and root(i) in succeeded:
+                        settle(i, record(i))
+                if ordered:
+                    while next_index in ready:
+                        yield ready.pop(next_index)
+                        next_index += 1
+                else:
+                    for i in list(ready):
+                        yield ready.pop(i)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, i = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error("Error: Unable to summarize {}, detail: {}".format(items[i][1].url, e))
+                        fail(i, str(e))
+                        continue
+                    if stage == "llm":
+                        if result:
+                            succeeded.add(i)
+                            settle(i, record(i, summary=result))
+                        else:
+                            fail(i, "empty summary")
+                    elif is_duplicate(i, result):
+                        contents[i] = result
+                    elif not result:
+                        fail(i, "unable to fetch the article")
+                    else:
+                        pending[summarize_later(result)] = ("llm", i)
+    finally:
+        # 调用方提前停止迭代时, 还没开始的下载和生成直接取消
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+    # 只算代表确实出了摘要的重复文章
+    saved = [i for i in duplicate_of if root(i) in succeeded]
+    if saved:
+        logger.info("Dedup: {} of {} articles are duplicates, saved {} downloads and {} LLM calls".format(
+            len(saved), len(items), sum(1 for i in saved if i not in fetched), len(saved) * (1 if fused else 2)))
+
+
+def print_summary(record: ArticleRecord, stream: bool = False, listed: Set[str] = None):
+    """
+    文本输出一条摘要记录; 已经作为 related 列出过的重复文章不再输出
+    """
+    listed = set() if listed is None else listed
+    article = record.article
+    if record.same_story_as:
+        if article.url not in listed:
+            # stream 模式下标题在生成前已经输出过
+            if not stream:
+                logger.info(f"Summary for {article.title}:")
+            print(f"same story as: {record.same_story_as}")
+        return
+    if record.summary is None:
+        return
+    if not stream:
+        logger.info(f"Summary for {article.title}:")
+        text_output(record.summary)
+    for url in record.related:
+        print(f"related: {url}")
+    listed.update(record.related)
+
+
+def summarize(items: Iterable[Tuple[News, NewsArticle]], fetch_workers: int = 4, llm_workers: int = 2,
+              fused: bool = False, stream: bool = False, dedup: bool = True,
+              use_cache: bool = True) -> List[ArticleRecord]:
+    """
+    按顺序打印 summarize_iter 的结果, 并返回所有记录
+    """
+    records, listed = [], set()
+    for record in summarize_iter(items, fetch_workers, llm_workers, fused, stream, dedup, use_cache=use_cache):
+        print_summary(record, stream, listed)
+        records.append(record)
+    return records
 
 
 @register_sources
 class Bloomberg(News):
 
     source = "bloomberg"
+    # 只构建 .article-text 的子树, 页面其余部分解析时直接跳过
+    # 解析阶段 class 还是原始字符串 (如 "article-text body-copy"), 要自己拆开比较
+    content_strainer = SoupStrainer(class_=lambda value: bool(value) and "article-text" in value.split())
+
+    @classmethod
+    def extract_content(cls, html: str) -> str:
+        soup = BeautifulSoup(html, 'html.parser', parse_only=cls.content_strainer)
+        # 一般只有一篇文章
+        element = soup.find(class_="article-text")
+        return element.get_text() if element else ""
 
     @retry_on_error()
-    def get_article_content(self, article_url: str) -> Tuple[str, int]:
+    def fetch_article_content(self, article_url: str) -> Tuple[str, int]:
         try:
-            response = requests.get(article_url)
+            with metrics.timer("article_download", source=self.source):
+                response = http_get(article_url)
         except requests.exceptions.RequestException as e:
             logger.error("Error: Unable to connect to Bloomberg API, detail: {}".format(e))
-            return "", ERR
+            return "", error_status(e)
         else:
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                article_class = soup.find_all(class_="article-text")
-                if article_class:
-                    # 一般只有一篇文章
-                    element = article_class[0].get_text()
-                    return element, OK
-                return "", OK
+                with metrics.timer("article_parse", source=self.source):
+                    return self.extract_content(response.text), OK
             else:
                 logger.warning("Error: Unable to fetch news from {}, detail: {}".format(self.source, response.text))
-                return "", ERR
+                return "", error_status(response)
     
-    def get_summary(self, topic: str, top_k: int = 3):
-        _summary = []
-        articles = self.get_articles(topic)
-        if articles:
-            if top_k >= len(articles):
-                top_k_articles = articles
-            else:
-                top_k_articles = articles[:top_k]
-            for article in top_k_articles:
-                logger.info(f"Generating summary for {article.title}...")
-                text_output(llm.generate_summary(self.get_article_content(article.url)))
-        return _summary
-    
-    def get_brief(self, topic: str):
-        articles = self.get_articles(topic)
-        for article in articles:
-            print(f"title: {article.title}")
-            print(f"url: {article.url}")
-            print(f"brief: ")
-            brief = article.description
-            text_output(brief)
-            print("-"*30)
-
 
 @register_sources
 class Reuters(News):
 
     source = "reuters"
+    # 只构建 <p> 的子树
+    content_strainer = SoupStrainer("p")
+
+    @classmethod
+    def extract_content(cls, html: str) -> str:
+        soup = BeautifulSoup(html, 'html.parser', parse_only=cls.content_strainer)
+        return "\n".join(element.text for element in soup.find_all('p'))
 
     @retry_on_error()
-    def get_article_content(self, article_url: str) -> Tuple[str, int]:
+    def fetch_article_content(self, article_url: str) -> Tuple[str, int]:
         try:
             article_url = article_url.replace("www.reuters.com", "neuters.de")
-            response = requests.get(article_url)
+            with metrics.timer("article_download", source=self.source):
+                response = http_get(article_url)
         except requests.exceptions.RequestException as e:
             logger.error("Error: Unable to connect to Reuters API, detail: {}".format(e))
-            return "", ERR
+            return "", error_status(e)
         else:
             if response.status_code == 200:
-                article_content = []
-                soup = BeautifulSoup(response.text, 'html.parser')
-                p_elements = soup.find_all('p')
-                if p_elements:
-                    for element in p_elements:
-                        article_content.append(element.text)
-                return "\n".join(article_content), OK
+                with metrics.timer("article_parse", source=self.source):
+                    return self.extract_content(response.text), OK
             else:
                 logger.warning("Error: Unable to fetch news from {}, detail: {}".format(self.source, response.text))
-                return "", ERR
-
-    def get_brief(self, topic: str):
-        articles = self.get_articles(topic)
-        for article in articles:
-            print(f"title: {article.title}")
-            print(f"url: {article.url}")
-            print(f"brief: ")
-            brief = article.description
-            text_output(brief)
-            print("-"*30)
+                return "", error_status(response)
 
 
 
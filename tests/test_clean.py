@@ -0,0 +1,75 @@
+"""
+clean.py 的测试: 模板段落要删掉, 长得像模板的正文要保留
+"""
+import unittest
+from clean import clean_content, is_boilerplate
+
+BOILERPLATE = [
+    "World · Business · Markets · Sustainability · Legal · Breakingviews",
+    "By Staff Reporter · 3 minutes ago",
+    "By Jane Doe and John Roe",
+    "Updated 10:32 AM EDT",
+    "Reporting by Staff Reporter; Editing by Desk Editor",
+    "Additional reporting by Jane Doe in London",
+    "Reporting by David Shepardson in Washington and Jane Doe in London; Editing by Chizu Nomiyama",
+    "Writing by Sam Holmes.",
+    "By Jane Doe - May 3, 2024",
+    "Our Standards: The Thomson Reuters Trust Principles.",
+    "FILE PHOTO: An oil pump jack is seen in Texas, U.S., May 3, 2020. REUTERS/Nick Oxford/File Photo",
+    "Traders work on the floor of the NYSE in New York City, U.S. (REUTERS/Brendan McDermid)",
+    "A view of the Federal Reserve building in Washington. Photographer: Al Drago/Bloomberg via Getty Images",
+    "Sign up here.",
+    "Sign up for our daily Morning Bid newsletter",
+    "Read more: Oil slides as demand worries mount",
+    "© 2024 Bloomberg L.P.",
+    "neuters is a privacy-friendly Reuters front-end.",
+    "* * *",
+    "—",
+]
+
+ARTICLE = [
+    "Oil rose 2% to $80 a barrel on Monday.",
+    "Support for the president fell to 38%, according to a Reuters/Ipsos poll completed on Tuesday.",
+    "The latest Reuters/Ipsos poll shows a tight race",
+    "Subscribe to the Fed to get more funding, analysts said.",
+    "By contrast, the Fed held rates steady.",
+    "By Tuesday prices rose 5% on strong demand from China.",
+    "Related talks collapsed on Monday.",
+    "Updated forecasts are due Friday.",
+    "Photos of the damage circulated widely on social media.",
+    "2023 1.5 2.4 3.1",
+    "2023 · 1.5 · 2.4 · 3.1",
+    "Shares of Getty Images rose 4% after the results.",
+    "Research by Goldman Sachs shows that inflation expectations have risen sharply since March.",
+    "Writing by hand remains common in some trading pits, the exchange said.",
+    "Editing by algorithms is increasingly common in newsrooms, the study found.",
+    "By March - the deadline set by regulators - banks must hold more capital.",
+]
+
+
+class BoilerplateTest(unittest.TestCase):
+
+    def test_boilerplate_is_dropped(self):
+        for paragraph in BOILERPLATE:
+            with self.subTest(paragraph=paragraph):
+                self.assertTrue(is_boilerplate(paragraph))
+
+    def test_article_text_is_kept(self):
+        for paragraph in ARTICLE:
+            with self.subTest(paragraph=paragraph):
+                self.assertFalse(is_boilerplate(paragraph))
+
+
+class CleanContentTest(unittest.TestCase):
+
+    def test_drops_duplicates_and_whitespace(self):
+        text = "  Oil  rose\t2%.  \n\n\nOIL ROSE 2%.\nBonds   fell.\n \n"
+        self.assertEqual(clean_content(text), "Oil rose 2%.\nBonds fell.")
+
+    def test_keeps_article_order(self):
+        text = "\n".join([BOILERPLATE[0], BOILERPLATE[1], *ARTICLE[:3], BOILERPLATE[4], BOILERPLATE[6]])
+        self.assertEqual(clean_content(text), "\n".join(ARTICLE[:3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+"""
+models.py 里不需要模型的部分: fused 输出的流式显示
+python -m pytest -q tests 或 python -m unittest discover tests
+"""
+import random
+import unittest
+from models import LLM, SummaryStream
+
+FUSED = "SUMMARY:\n  The Fed held rates.\nIt said more.\n\nTRANSLATION:\n美联储维持利率不变。\n"
+
+
+def split(text, n):
+    cuts = sorted(random.sample(range(1, len(text)), n))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+class HideFusedMarkersTest(unittest.TestCase):
+
+    def test_markers_hidden_wherever_chunks_are_cut(self):
+        random.seed(0)
+        for n in [0, 1, 5, 20, len(FUSED) - 1]:
+            stream = SummaryStream(LLM.hide_fused_markers(split(FUSED, n)))
+            self.assertEqual("".join(stream), "The Fed held rates.\nIt said more.\n\n美联储维持利率不变。")
+            # 返回值是原始输出, 交给 parse_fused_output
+            self.assertEqual(stream.result, FUSED)
+            self.assertEqual(LLM.parse_fused_output(stream.result).translation, "美联储维持利率不变。")
+
+    def test_output_without_markers_is_shown_as_is(self):
+        self.assertEqual("".join(LLM.hide_fused_markers(["no markers ", "here\n"])), "no markers here")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,302 @@
+"""
+traffic.py 和 tools.http_get / retry_on_error 的测试, 上游是本地 http.server 桩, 按路径依次返回预设的状态码
+python -m pytest -q tests 或 python -m unittest discover tests
+"""
+import time
+import random
+import asyncio
+import functools
+import threading
+import unittest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from common import OK
+from traffic import CircuitBreaker, CircuitOpenError, RetryPolicy, TokenBucket, host_traffic
+from tools import error_status, http_get, http_get_async, retry_on_error
+
+
+class Stub(ThreadingHTTPServer):
+    """
+    scripts[path] 是依次返回的 (status, headers), 用完后重复最后一个; hits 记录每个路径收到的请求数
+    """
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        self.scripts: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+        self.hits: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), StubHandler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_response(self, path: str) -> Tuple[int, Dict[str, str]]:
+        with self.lock:
+            n = self.hits.get(path, 0)
+            self.hits[path] = n + 1
+            script = self.scripts.get(path, [(404, {})])
+            return script[min(n, len(script) - 1)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        status, headers = self.server.next_response(self.path)
+        body = str(status).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Fetcher:
+    """
+    和 sources 里的 fetch_article_content 一样: 返回 (结果, 状态码), 交给 retry_on_error 决定是否重试
+    """
+
+    def __init__(self, retry_times: int = 3) -> None:
+        policy = RetryPolicy(retry_times, base=0.01, cap=0.02)
+        self.get = functools.partial(retry_on_error(policy=policy)(Fetcher.fetch), self)
+
+    def fetch(self, url: str):
+        try:
+            response = http_get(url)
+        except requests.exceptions.RequestException as e:
+            return None, error_status(e)
+        if response.status_code == 200:
+            return response.status_code, OK
+        return response.status_code, error_status(response)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_backoff_is_full_jitter_under_cap(self):
+        random.seed(0)
+        policy = RetryPolicy(base=1.0, cap=5.0)
+        for attempt in range(6):
+            delays = [policy.backoff(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= min(5.0, 2 ** attempt) for delay in delays))
+            # 是随机分布而不是固定值, 同时失败的 worker 不会一起重试
+            self.assertGreater(len(set(delays)), 100)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.02)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.02)
+
+    def test_pause_delays_every_caller(self):
+        bucket = TokenBucket(rate=1000, capacity=1000)
+        bucket.pause(0.5)
+        self.assertGreater(bucket.reserve(), 0.4)
+        self.assertGreater(bucket.reserve(), 0.4)
+
+    def test_acquire_async_waits_without_blocking_the_loop(self):
+        bucket = TokenBucket(rate=1000, capacity=1000)
+        bucket.pause(0.2)
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.02)
+
+        async def main():
+            start = time.monotonic()
+            await asyncio.gather(bucket.acquire_async(), ticker())
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(main()), 0.19)
+        self.assertEqual(len(ticks), 5)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # 试探请求还没回来时, 其他请求仍然拒绝
+        self.assertFalse(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_successful_probe_closes(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_lost_probe_is_replaced_after_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        # 试探请求一直没有结果
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+
+class HttpTrafficTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = Stub()
+        threading.Thread(target=cls.stub.serve_forever, daemon=True).start()
+        cls.host = cls.stub.url.split("//")[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+
+    def setUp(self):
+        self.saved = host_traffic.failure_threshold, host_traffic.reset_timeout
+        host_traffic.failure_threshold, host_traffic.reset_timeout = 3, 0.2
+        # set_limit 会丢掉这个 host 已有的令牌桶和熔断器
+        host_traffic.set_limit(self.host, 1000, 1000)
+        self.stub.scripts.clear()
+        self.stub.hits.clear()
+
+    def tearDown(self):
+        host_traffic.failure_threshold, host_traffic.reset_timeout = self.saved
+        host_traffic.set_limit(self.host, 1000, 1000)
+
+    def test_404_is_not_retried(self):
+        self.stub.scripts["/missing"] = [(404, {})]
+        self.assertEqual(Fetcher().get(self.stub.url + "/missing"), 404)
+        self.assertEqual(self.stub.hits["/missing"], 1)
+
+    def test_503_is_retried_until_success(self):
+        self.stub.scripts["/flaky"] = [(503, {}), (503, {}), (200, {})]
+        self.assertEqual(Fetcher(retry_times=3).get(self.stub.url + "/flaky"), 200)
+        self.assertEqual(self.stub.hits["/flaky"], 3)
+
+    def test_retries_give_up_after_retry_times(self):
+        self.stub.scripts["/down"] = [(503, {})]
+        self.assertEqual(Fetcher(retry_times=2).get(self.stub.url + "/down"), 503)
+        self.assertEqual(self.stub.hits["/down"], 2)
+
+    def test_retry_after_pauses_the_host(self):
+        self.stub.scripts["/busy"] = [(503, {"Retry-After": "0.3"}), (200, {})]
+        self.assertEqual(http_get(self.stub.url + "/busy").status_code, 503)
+        # 同一个 host 的其他路径也要等
+        start = time.monotonic()
+        self.stub.scripts["/other"] = [(200, {})]
+        self.assertEqual(http_get(self.stub.url + "/other").status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_async_get_respects_retry_after(self):
+        self.stub.scripts["/busy"] = [(429, {"Retry-After": "0.3"}), (200, {})]
+        self.assertEqual(http_get(self.stub.url + "/busy").status_code, 429)
+        start = time.monotonic()
+        response = asyncio.run(http_get_async(self.stub.url + "/busy"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_breaker_opens_and_stops_hitting_the_host(self):
+        self.stub.scripts["/down"] = [(503, {})]
+        for _ in range(3):
+            self.assertEqual(http_get(self.stub.url + "/down").status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            http_get(self.stub.url + "/down")
+        self.assertEqual(self.stub.hits["/down"], 3)
+        # 熔断打开时 retry_on_error 不再重试
+        self.assertEqual(Fetcher().get(self.stub.url + "/down"), None)
+        self.assertEqual(self.stub.hits["/down"], 3)
+
+    def test_half_open_probe(self):
+        self.stub.scripts["/down"] = [(503, {}), (503, {}), (503, {}), (503, {}), (200, {})]
+        for _ in range(3):
+            http_get(self.stub.url + "/down")
+        time.sleep(0.25)
+        # 试探失败, 重新打开
+        self.assertEqual(http_get(self.stub.url + "/down").status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            http_get(self.stub.url + "/down")
+        time.sleep(0.25)
+        # 试探成功, 关闭
+        self.assertEqual(http_get(self.stub.url + "/down").status_code, 200)
+        self.assertEqual(http_get(self.stub.url + "/down").status_code, 200)
+        self.assertEqual(self.stub.hits["/down"], 6)
+
+    def open_breaker(self):
+        self.stub.scripts["/down"] = [(503, {})]
+        for _ in range(3):
+            http_get(self.stub.url + "/down")
+        time.sleep(0.25)
+
+    def test_cancelled_async_probe_reopens(self):
+        self.open_breaker()
+        limiter, breaker = host_traffic.for_url(self.stub.url)
+        limiter.pause(5)
+
+        async def main():
+            task = asyncio.create_task(http_get_async(self.stub.url + "/ok"))
+            await asyncio.sleep(0.05)
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_unexpected_error_in_probe_reopens(self):
+        self.open_breaker()
+        with self.assertRaises(TypeError):
+            http_get(self.stub.url + "/ok", no_such_argument=1)
+        _, breaker = host_traffic.for_url(self.stub.url)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.25)
+        self.stub.scripts["/ok"] = [(200, {})]
+        self.assertEqual(http_get(self.stub.url + "/ok").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,157 @@
+import re
+import sys
+import json
 import time
+import asyncio
+import functools
 import loguru
 import requests
-from common import OK
+import threading
+from urllib.parse import urlsplit
+from typing import Iterable, List, Tuple
+from requests.adapters import HTTPAdapter
+from common import ERR, FATAL
+from metrics import metrics
+from traffic import (RETRYABLE_STATUS, CircuitBreaker, CircuitOpenError, RetryPolicy, TokenBucket, host_traffic,
+                     retry_after)
 
 
 logger = loguru.logger
 
+HTTP_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    每个 host 共用一个带连接池的 session, 复用 TCP/TLS 连接
+    """
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+    return session
+
+
+def _admit(url: str) -> Tuple[TokenBucket, CircuitBreaker]:
+    limiter, breaker = host_traffic.for_url(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"circuit open for {urlsplit(url).netloc}")
+    return limiter, breaker
+
+
+def _send(url: str, limiter: TokenBucket, breaker: CircuitBreaker, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    response = get_session(url).get(url, **kwargs)
+    host = urlsplit(url).netloc
+    metrics.inc("news_http_requests_total", host=host, status=response.status_code)
+    metrics.inc("news_http_response_bytes_total", len(response.content), host=host)
+    if response.status_code in RETRYABLE_STATUS:
+        breaker.record_failure()
+        limiter.pause(retry_after(response))
+    else:
+        breaker.record_success()
+    return response
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """
+    经过 host 级别的熔断和限速; 熔断打开时抛 CircuitOpenError (是 RequestException 的子类)
+    """
+    limiter, breaker = _admit(url)
+    try:
+        limiter.acquire()
+        return _send(url, limiter, breaker, **kwargs)
+    except BaseException:
+        # 任何异常都记失败, 包括非网络异常和被中断; 半开状态的试探请求没有结果时熔断器会一直拒绝
+        breaker.record_failure()
+        raise
+
+
+def error_status(failure) -> int:
+    """
+    请求失败(异常或非 200 响应)对应的状态码: 可重试的返回 ERR, 否则 FATAL
+    """
+    if isinstance(failure, CircuitOpenError):
+        return FATAL
+    if isinstance(failure, requests.Response):
+        return ERR if failure.status_code in RETRYABLE_STATUS else FATAL
+    return ERR
+
+
+async def http_get_async(url: str, **kwargs) -> requests.Response:
+    """
+    和 http_get 一样经过熔断和限速, 限速等待用 asyncio.sleep 不占线程; 请求本身是阻塞的 requests, 放到线程里执行
+    """
+    limiter, breaker = _admit(url)
+    try:
+        await limiter.acquire_async()
+        return await asyncio.to_thread(_send, url, limiter, breaker, **kwargs)
+    except BaseException:
+        # 包括任务在等待限速或请求时被取消 (CancelledError)
+        breaker.record_failure()
+        raise
+
+
+# 粗略估算 token 数: 中文按字, 英文按词和标点
+_token_pattern = re.compile(r"[\u4e00-\u9fff]|\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    return len(_token_pattern.findall(text))
+
+
+_sentence_end = re.compile(r"(?<=[.!?。！？])\s+")
+
+
+def _split_tokens(text: str, max_tokens: int) -> List[str]:
+    starts = [m.start() for m in _token_pattern.finditer(text)]
+    return [text[starts[i]:starts[i + max_tokens] if i + max_tokens < len(starts) else len(text)].strip()
+            for i in range(0, len(starts), max_tokens)]
+
+
+def split_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    按 token 数切块, 每块不超过 max_tokens; 尽量在段落边界切, 段落太长再按句子, 最后按 token 硬切
+    块的大小尽量平均, 并发处理时耗时取决于最大的那块
+    """
+    pieces = []
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _sentence_end.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+            else:
+                pieces.extend(_split_tokens(sentence, max_tokens))
+    sizes = [count_tokens(piece) for piece in pieces]
+    total = sum(sizes)
+    if not total:
+        return []
+    # 先算至少要几块, 再按平均大小贪心装
+    target = -(-total // -(-total // max_tokens))
+    chunks, current, size = [], [], 0
+    for piece, n in zip(pieces, sizes):
+        if current and (size + n > max_tokens or size >= target):
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += n
+    chunks.append("\n".join(current))
+    return chunks
+
 
 def text_output(text: str, max_line_num=100):
     start = 0
@@ -17,32 +163,92 @@ def text_output(text: str, max_line_num=100):
     print(text[start:])
 
 
+def stream_output(chunks: Iterable[str], max_line_num=100) -> str:
+    """
+    边生成边输出, 和 text_output 一样每 max_line_num 个字符换行, 返回完整文本
+    """
+    text = []
+    column = 0
+    for chunk in chunks:
+        text.append(chunk)
+        line = []
+        for char in chunk:
+            if char == "\n":
+                column = 0
+            else:
+                if column == max_line_num:
+                    line.append("\n")
+                    column = 0
+                column += 1
+            line.append(char)
+        sys.stdout.write("".join(line))
+        sys.stdout.flush()
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    return "".join(text)
+
+
+def ndjson_output(records: Iterable) -> int:
+    """
+    每条记录 (pydantic model 或 dict) 输出一行 json 并立即 flush, 下游可以边读边处理, 返回条数
+    """
+    count = 0
+    for record in records:
+        line = record.model_dump_json() if hasattr(record, "model_dump_json") else json.dumps(record, ensure_ascii=False)
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+        count += 1
+    return count
+
+
+def translate_texts(texts: List[str], quantize: bool = None) -> List[str]:
+    """
+    用常驻的 NLLB 模型一次批量翻译, 英文 -> 中文
+    """
+    from NLLB import get_translator
+
+    metrics.inc("news_translate_texts_total", len(texts))
+    with metrics.timer("translate"):
+        return get_translator(quantize).translate_batch(texts, src_lang="eng_Latn", tgt_lang="zho_Hans")
+
+
 def translate_text(text):
-    data = [text, "en", "zh"]
-    url = "https://hf.space/embed/mikeee/gradio-deepl/+/api/predict"
-    resp = requests.post(url, json={"data": data})
-    if resp.status_code == 200:
-        print(resp.json())
-        return resp.json()["data"][0]
-    return text
+    return translate_texts([text])[0]
 
 
-def retry_on_error(retry_times=3):
+def retry_on_error(retry_times=3, policy: RetryPolicy = None):
     """
     被装饰的函数必须同时返回结果、和状态码
-    状态码 OK, ERR = 1, 0
+    状态码 OK, ERR, FATAL = 1, 0, -1, 只有 ERR 会重试, FATAL (如 404) 直接返回
+    重试前按 policy 做带 jitter 的指数退避; async 函数用 asyncio.sleep, 不阻塞事件循环
     """
+    policy = policy or RetryPolicy(retry_times)
 
     def wrapper(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_inner(self, *args, **kwargs):
+                for n in range(policy.retry_times):
+                    result, status = await func(self, *args, **kwargs)
+                    if status != ERR or n + 1 == policy.retry_times:
+                        return result
+                    delay = policy.backoff(n)
+                    logger.warning(f"retry {1+n} times in {delay:.1f}s")
+                    metrics.inc("news_retries_total", function=func.__qualname__)
+                    await asyncio.sleep(delay)
+
+            return async_inner
+
+        @functools.wraps(func)
         def inner(self, *args, **kwargs):
-            for n in range(retry_times):
+            for n in range(policy.retry_times):
                 result, status = func(self, *args, **kwargs)
-                if status == OK:
+                if status != ERR or n + 1 == policy.retry_times:
                     return result
-                else:
-                    logger.warning(f"retry {1+n} times")
-                    time.sleep(1 + n)
-            return result
+                delay = policy.backoff(n)
+                logger.warning(f"retry {1+n} times in {delay:.1f}s")
+                metrics.inc("news_retries_total", function=func.__qualname__)
+                time.sleep(delay)
 
         return inner
 
@@ -0,0 +1,158 @@
+"""
+请求流量控制: 带 jitter 的指数退避、按 host 的令牌桶限速和熔断
+"""
+import time
+import random
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+import requests
+
+# 只有这些状态码值得重试, 其他 4xx 重试也不会成功
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class RetryPolicy:
+    """
+    full jitter 指数退避: 第 n 次重试前等待 uniform(0, min(cap, base * 2 ** n)) 秒
+    多个 worker 同时失败时不会在同一时刻一起重试
+    """
+
+    def __init__(self, retry_times: int = 3, base: float = 1.0, cap: float = 30.0) -> None:
+        self.retry_times = retry_times
+        self.base = base
+        self.cap = cap
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    令牌桶: 每秒补充 rate 个, 最多攒 capacity 个
+    reserve() 预占一个令牌并返回需要等待的秒数, 同步调用方 sleep, asyncio 调用方 await asyncio.sleep
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """
+        服务端要求退避 (Retry-After) 时, 这个 host 的所有请求都等到那之后
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        import asyncio
+
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开, 拒绝请求 reset_timeout 秒
+    之后进入半开状态放一个请求试探, 成功则关闭, 失败重新打开
+    试探请求超过 reset_timeout 还没有结果 (比如调用方丢掉了它), 再放一个新的试探
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_at = now
+                return True
+            if self.state == self.HALF_OPEN and now - self._probe_at >= self.reset_timeout:
+                self._probe_at = now
+                return True
+            return self.state == self.CLOSED
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class HostTraffic:
+    """
+    每个 host 一个令牌桶和熔断器, limits 里可以单独给某个 host 设置 (rate, capacity)
+    """
+
+    def __init__(self, rate: float = 5.0, capacity: float = 10.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.limits: Dict[str, Tuple[float, float]] = {}
+        self._hosts: Dict[str, Tuple[TokenBucket, CircuitBreaker]] = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, host: str, rate: float, capacity: float) -> None:
+        with self._lock:
+            self.limits[host] = (rate, capacity)
+            self._hosts.pop(host, None)
+
+    def for_url(self, url: str) -> Tuple[TokenBucket, CircuitBreaker]:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                rate, capacity = self.limits.get(host, (self.rate, self.capacity))
+                self._hosts[host] = (TokenBucket(rate, capacity),
+                                     CircuitBreaker(self.failure_threshold, self.reset_timeout))
+            return self._hosts[host]
+
+
+def retry_after(response: requests.Response) -> float:
+    value = response.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return 0.0
+
+
+host_traffic = HostTraffic()
@@ -0,0 +1,90 @@
+import os
+import sched
+import json
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, List
+from cache import CACHE_DIR
+from tools import logger
+from sources import News, NewsArticle
+
+
+class SeenSet:
+    """
+    按 source 记录已经输出过的 article.id, 持久化成 json, 每个 source 只保留最近 max_size 个
+    """
+
+    def __init__(self, path: str = os.path.join(CACHE_DIR, "seen.json"), max_size: int = 5000) -> None:
+        self.path = path
+        self.max_size = max_size
+        self._ids: Dict[str, deque] = {}
+        self._lookup: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for source, ids in json.load(f).items():
+                    self._ids[source] = deque(ids[-max_size:], maxlen=max_size)
+                    self._lookup[source] = set(self._ids[source])
+
+    def filter_new(self, source: str, articles: List[NewsArticle]) -> List[NewsArticle]:
+        """
+        返回没见过的文章, 并把它们标记为已见
+        """
+        with self._lock:
+            ids = self._ids.setdefault(source, deque(maxlen=self.max_size))
+            lookup = self._lookup.setdefault(source, set())
+            new_articles = []
+            for article in articles:
+                if article.id in lookup:
+                    continue
+                if len(ids) == ids.maxlen:
+                    lookup.discard(ids[0])
+                ids.append(article.id)
+                lookup.add(article.id)
+                new_articles.append(article)
+            return new_articles
+
+    def save(self) -> None:
+        with self._lock:
+            data = {source: list(ids) for source, ids in self._ids.items()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class Watcher:
+    """
+    常驻轮询: 每个 source 按自己的间隔拉取 feed, 按 article.id 和 seen 集合比较, 只把新文章交给 on_new
+    """
+
+    def __init__(self, clients: Dict[News, float], on_new: Callable[[News, List[NewsArticle]], None],
+                 topic: str = "", seen: SeenSet = None) -> None:
+        self.clients = clients
+        self.on_new = on_new
+        self.topic = topic
+        self.seen = seen or SeenSet()
+        self.scheduler = sched.scheduler(time.monotonic, time.sleep)
+
+    def poll(self, client: News) -> None:
+        interval = self.clients[client]
+        try:
+            articles = client.get_articles(self.topic)
+            new_articles = self.seen.filter_new(client.source, articles)
+            if new_articles:
+                logger.info(f"{len(new_articles)} new articles from {client.source}")
+                self.on_new(client, new_articles)
+                self.seen.save()
+        except Exception as e:
+            logger.error("Error: Unable to poll {}, detail: {}".format(client.source, e))
+        self.scheduler.enter(interval, 0, self.poll, (client,))
+
+    def run(self) -> None:
+        for client in self.clients:
+            self.scheduler.enter(0, 0, self.poll, (client,))
+        try:
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            self.seen.save()